@@ -0,0 +1,201 @@
+"""
+Admission control, deadlines and load shedding for the LLM-backed routes.
+
+- Each limited route has a concurrency limit and a bounded wait queue. A
+  request that finds the queue full, or waits longer than the queue
+  timeout, gets an immediate 503 with Retry-After instead of piling up.
+- Every admitted request carries an end-to-end deadline (route default,
+  optionally shortened by an `X-Request-Timeout` header in seconds) in a
+  context variable. llm_client caps its scheduler wait, HTTP timeouts and
+  retry sleeps with the time remaining.
+- Routes not listed (health, metrics, PDFs, job polling) are never queued.
+
+Config (environment):
+- ADMISSION_LIMITS          JSON {"/route": [concurrency, queue size, deadline seconds]}
+                            merged over the defaults below
+- ADMISSION_QUEUE_TIMEOUT   longest wait for a slot, in seconds (default 10)
+"""
+
+from __future__ import annotations
+import asyncio
+import contextvars
+import json
+import math
+import os
+import time
+from typing import Awaitable, Dict, Optional, TypeVar
+
+from starlette.responses import JSONResponse
+
+import config  # loads .env once, before the config below is read
+import metrics
+
+T = TypeVar("T")
+
+DEFAULT_LIMITS = {
+    "/solve_doubt": (64, 256, 45.0),
+    "/solve_doubt_stream": (64, 256, 90.0),
+    "/grade_batch": (16, 64, 120.0),
+    "/grade_batch_stream": (16, 64, 180.0),
+    "/grade_feedback": (32, 128, 60.0),
+    "/generate_planner": (8, 32, 180.0),
+    "/replan": (8, 32, 180.0),
+}
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+# ------------------------------
+# Deadlines
+# ------------------------------
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline (None outside a limited request)."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def cap_timeout(timeout: float) -> float:
+    """`timeout` shortened to the time remaining; raises DeadlineExceeded if none is left."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return min(timeout, left)
+
+
+def clear_deadline() -> None:
+    """Run the rest of the current context without a request deadline (shared work)."""
+    _deadline.set(None)
+
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(left, 0))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Request deadline exceeded") from None
+
+
+# ------------------------------
+# Per-route limiter
+# ------------------------------
+class RouteLimiter:
+    def __init__(self, route: str, concurrency: int, queue_size: int, deadline: float):
+        self.route = route
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+        self.service_time = 1.0  # moving average of seconds per request, for Retry-After
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def acquire(self, timeout: float) -> Optional[str]:
+        """Take a slot; returns the reason if the request should be shed instead."""
+        if not self._slots.locked():
+            await self._slots.acquire()  # a slot is free: returns without waiting
+            self.active += 1
+            return None
+        if self.waiting >= self.queue_size:
+            return "queue_full"
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=max(timeout, 0))
+        except asyncio.TimeoutError:
+            return "queue_timeout"
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return None
+
+    def release(self, elapsed: float) -> None:
+        self.active -= 1
+        self._slots.release()
+        self.service_time += 0.1 * (elapsed - self.service_time)
+
+    def retry_after(self) -> int:
+        """Rough time for the current backlog to drain."""
+        backlog = self.waiting + self.active
+        return max(1, math.ceil(self.service_time * backlog / self.concurrency))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "deadline": self.deadline,
+            "shed": self.shed,
+            "service_time": round(self.service_time, 3),
+        }
+
+
+def _load_limits() -> Dict[str, RouteLimiter]:
+    limits = dict(DEFAULT_LIMITS)
+    raw = os.getenv("ADMISSION_LIMITS", "")
+    if raw:
+        limits.update({route: tuple(v) for route, v in json.loads(raw).items()})
+    return {route: RouteLimiter(route, int(c), int(q), float(d)) for route, (c, q, d) in limits.items()}
+
+
+limiters = _load_limits()
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    return {route: limiter.stats() for route, limiter in limiters.items()}
+
+
+def _requested_timeout(scope) -> Optional[float]:
+    for name, value in scope.get("headers", []):
+        if name == b"x-request-timeout":
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the route limiters and setting the request deadline."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limiter = limiters.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if limiter is None:
+            return await self.app(scope, receive, send)
+
+        arrived = time.monotonic()
+        budget = limiter.deadline
+        requested = _requested_timeout(scope)
+        if requested is not None and requested > 0:
+            budget = min(budget, requested)
+
+        reason = await limiter.acquire(min(QUEUE_TIMEOUT, budget))
+        if reason is not None:
+            limiter.shed += 1
+            metrics.REQUESTS_SHED.inc(route=limiter.route, reason=reason)
+            response = JSONResponse(
+                status_code=503,
+                content={"error": "Server busy, please retry", "reason": reason},
+                headers={"Retry-After": str(limiter.retry_after())},
+            )
+            return await response(scope, receive, send)
+
+        token = _deadline.set(arrived + budget)
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _deadline.reset(token)
+            limiter.release(time.monotonic() - started)
@@ -0,0 +1,69 @@
+"""
+Benchmark llm_json.extract_json against large LLM-style outputs.
+
+Usage:
+    python bench/bench_json.py [--evaluations 400] [--repeat 20]
+
+Cases: clean JSON (compared with plain json.loads), JSON wrapped in chatter
+and code fences with trailing commas, and output truncated mid-string as
+when the model hits max_tokens.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_json import extract_json  # noqa: E402
+
+
+def make_output(n: int) -> str:
+    evaluations = [
+        {
+            "question_number": f"{i // 10 + 1}({'i' * (i % 3 + 1)})",
+            "type": "descriptive",
+            "verdict": "partially correct",
+            "marks_awarded": 1,
+            "total_marks": 2,
+            "mistake": "Missed the second key concept about refraction {and} [dispersion].",
+            "correct_answer": ["Light bends towards the normal", "Speed decreases in a denser medium"],
+            "mistake_type": "conceptual",
+            "feedback": "You explained bending correctly but did not say why. " * 4,
+        }
+        for i in range(n)
+    ]
+    return json.dumps({"evaluations": evaluations, "total_marks_awarded": n, "total_marks_possible": 2 * n}, indent=2)
+
+
+def timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--evaluations", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    clean = make_output(args.evaluations)
+    messy = "Sure! Here is the JSON:\n```json\n" + clean.replace("\n  ]", ",\n  ]") + "\n```\nLet me know!"
+    truncated = clean[: int(len(clean) * 0.8)]
+
+    print(f"output size: {len(clean) / 1024:.0f} KiB, {args.evaluations} evaluations")
+    print(f"{'case':<12}{'ms/op':>10}  repairs")
+    print(f"{'json.loads':<12}{timeit(lambda: json.loads(clean), args.repeat):>10.2f}  -")
+    for name, text in (("clean", clean), ("messy", messy), ("truncated", truncated)):
+        result = extract_json(text)
+        ms = timeit(lambda: extract_json(text), args.repeat)
+        kept = len(result.value.get("evaluations", []))
+        print(f"{name:<12}{ms:>10.2f}  {', '.join(result.repairs) or '-'} ({kept} evaluations kept)")
+
+
+if __name__ == "__main__":
+    main()
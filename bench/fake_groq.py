@@ -0,0 +1,182 @@
+"""
+Local stand-in for Groq's /openai/v1/chat/completions, for benchmarks.
+
+Answers in the shape each caller expects (grading evaluations, planner days,
+doubt/summary text), with configurable latency, streaming speed, 429s and
+malformed JSON.
+
+Usage:
+    python bench/fake_groq.py --port 8900 --latency-ms 800 --rate-429 0.05
+    GROQ_ENDPOINT=http://127.0.0.1:8900/openai/v1/chat/completions uvicorn main:app
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+
+class Config:
+    latency_ms = 500.0
+    jitter_ms = 200.0
+    tokens_per_sec = 400.0
+    rate_429 = 0.0
+    rate_malformed = 0.0
+    retry_after = 1.0
+
+
+# ------------------------------
+# Canned completions
+# ------------------------------
+def grading_content(prompt: str) -> str:
+    blocks = re.findall(r"Question Number: (.+)\n.*?Question Type: (.*)\n.*?Total Marks: (\d+)", prompt)
+    evaluations = []
+    for qnum, qtype, marks in blocks:
+        awarded = random.randint(0, int(marks))
+        evaluations.append({
+            "question_number": qnum.strip(),
+            "type": qtype.strip(),
+            "verdict": "correct" if awarded == int(marks) else "partially correct",
+            "marks_awarded": awarded,
+            "total_marks": int(marks),
+            "mistake": "Missed a key concept",
+            "correct_answer": ["concept one", "concept two"],
+            "mistake_type": "conceptual",
+            "feedback": "Revise this chapter and explain each step in your own words. " * 3,
+        })
+    total = sum(int(m) for _, _, m in blocks)
+    return json.dumps({
+        "evaluations": evaluations,
+        "total_marks_awarded": sum(e["marks_awarded"] for e in evaluations),
+        "total_marks_possible": total,
+    })
+
+
+def planner_content(prompt: str) -> str:
+    dates = re.search(r"Study dates \(fixed, YYYY-MM-DD\): (.*)", prompt).group(1).split(", ")
+    return json.dumps({"days": [
+        {"date": d, "tasks": [
+            {"subject": "Physics", "chapter": "Light", "task": "Solve numericals", "estimated_time": 40},
+            {"break": 20},
+            {"subject": "Chemistry", "chapter": "Acids", "task": "Revise notes", "estimated_time": 30},
+        ]}
+        for d in dates
+    ]})
+
+
+def completion_text(prompt: str) -> str:
+    if "Question Number:" in prompt:
+        return grading_content(prompt)
+    if "Study dates (fixed" in prompt:
+        return planner_content(prompt)
+    if "running summary" in prompt:
+        return "- Student asked about refraction\n- Confused about critical angle"
+    return "Photosynthesis is how plants make food from sunlight, water and carbon dioxide. " * 4
+
+
+def malform(text: str) -> str:
+    """Typical LLM JSON defects: chatter, fences, trailing commas or truncation."""
+    if not text.startswith("{"):
+        return text
+    choice = random.choice(["chatter", "trailing_comma", "truncate"])
+    if choice == "chatter":
+        return "Sure! Here is the JSON:\n```json\n" + text + "\n```"
+    if choice == "trailing_comma":
+        return text[:-1] + ",}"
+    return text[: int(len(text) * 0.7)]
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+# ------------------------------
+# Endpoint
+# ------------------------------
+async def chat_completions(request: Request) -> Response:
+    payload = await request.json()
+    if random.random() < Config.rate_429:
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached", "type": "tokens"}},
+            status_code=429,
+            headers={"retry-after": str(Config.retry_after)},
+        )
+
+    prompt = "".join(m.get("content", "") for m in payload.get("messages", []))
+    text = completion_text(prompt)
+    if random.random() < Config.rate_malformed:
+        text = malform(text)
+
+    prompt_tokens = estimate_tokens(prompt)
+    completion_tokens = estimate_tokens(text)
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+    latency = max(0.0, (Config.latency_ms + random.uniform(-1, 1) * Config.jitter_ms) / 1000)
+
+    if payload.get("stream"):
+        async def events():
+            await asyncio.sleep(latency)
+            pieces = re.findall(r".{1,16}", text, re.S)
+            # ~4 tokens per 16-char piece
+            delay = 4 / Config.tokens_per_sec if Config.tokens_per_sec > 0 else 0
+            for piece in pieces:
+                yield "data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": piece}}]}) + "\n\n"
+                if delay:
+                    await asyncio.sleep(delay)
+            yield "data: " + json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                                         "x_groq": {"usage": usage}}) + "\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    generation = completion_tokens / Config.tokens_per_sec if Config.tokens_per_sec > 0 else 0
+    await asyncio.sleep(latency + generation)
+    return JSONResponse({
+        "id": f"fake-{time.time_ns()}",
+        "object": "chat.completion",
+        "model": payload.get("model", ""),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": usage,
+    })
+
+
+app = Starlette(routes=[
+    Route("/openai/v1/chat/completions", chat_completions, methods=["POST"]),
+    Route("/openai/v1/models", lambda request: JSONResponse({"data": []}), methods=["GET"]),
+])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Groq chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=Config.latency_ms, help="time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=Config.jitter_ms)
+    parser.add_argument("--tokens-per-sec", type=float, default=Config.tokens_per_sec, help="0 = instant")
+    parser.add_argument("--rate-429", type=float, default=Config.rate_429, help="fraction of requests throttled")
+    parser.add_argument("--rate-malformed", type=float, default=Config.rate_malformed,
+                        help="fraction of JSON answers returned malformed")
+    parser.add_argument("--retry-after", type=float, default=Config.retry_after)
+    args = parser.parse_args()
+
+    Config.latency_ms = args.latency_ms
+    Config.jitter_ms = args.jitter_ms
+    Config.tokens_per_sec = args.tokens_per_sec
+    Config.rate_429 = args.rate_429
+    Config.rate_malformed = args.rate_malformed
+    Config.retry_after = args.retry_after
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
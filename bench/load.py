@@ -0,0 +1,245 @@
+"""
+Load harness for the API, backed by the fake Groq server.
+
+Starts bench/fake_groq.py and the app (uvicorn main:app, pointed at the
+fake via GROQ_ENDPOINT, with a generated offline paper for /questions),
+drives the routes at the given concurrency and reports p50/p95/p99 latency,
+throughput and error rate per route. Results can be saved and compared
+against a baseline run.
+
+Usage:
+    python bench/load.py --concurrency 50 --requests 500
+    python bench/load.py --routes solve_doubt,grade_batch --save bench_baseline.json
+    python bench/load.py --compare bench_baseline.json --fake-args="--rate-429 0.1"
+    python bench/load.py --target http://127.0.0.1:8000   # already-running app
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_PAPER = "bench_paper"
+
+
+# ------------------------------
+# Request generators
+# ------------------------------
+def grade_batch_request(i: int) -> Tuple[str, str, Dict[str, Any]]:
+    questions = [
+        {"question_number": "1(i)", "type": "mcq", "marks": 1, "correct_answer": "(b) convex lens",
+         "user_answer": random.choice(["b", "c"])},
+        {"question_number": "2(ii)", "type": "numerical", "marks": 2, "correct_answer": "f = 24 cm, P = 4.17 D",
+         "user_answer": random.choice(["24 cm and 4.17 D", "24 cm, 4 D"])},
+        {"question_number": "3", "type": "diagram", "marks": 2, "correct_answer": "Ray diagram", "user_answer": ""},
+    ] + [
+        {"question_number": f"{4 + q}", "type": "descriptive", "marks": 3,
+         "correct_answer": "Refraction is the bending of light when it passes between media of different optical density.",
+         "user_answer": f"Light bends when it changes medium (student {i % 40})"}
+        for q in range(4)
+    ]
+    return "POST", "/grade_batch", {"questions": questions}
+
+
+def solve_doubt_request(i: int) -> Tuple[str, str, Dict[str, Any]]:
+    topics = ["photosynthesis", "refraction", "Ohm's law", "moment of force", "latent heat", "echo"]
+    topic = random.choice(topics) if random.random() < 0.5 else f"{random.choice(topics)} case {i}"
+    return "POST", "/solve_doubt", {"prompt": f"What is {topic}?", "important": False, "context": []}
+
+
+def planner_request(i: int) -> Tuple[str, str, Dict[str, Any]]:
+    return "POST", "/generate_planner", {
+        "subjects": ["Physics", "Chemistry"],
+        "chapters": [f"Chapter {c}" for c in range(8)],
+        "study_goals": "Score 90+",
+        "strengths": ["Chemistry"],
+        "weaknesses": ["Physics"],
+        "time_available": 120,
+        "target": [2027, 2, 20],
+        "days_until_target": 60,
+        "days_per_week": ["monday", "wednesday", "friday", "saturday"],
+        "start_date": [2026, 12, 21],
+    }
+
+
+def questions_request(i: int) -> Tuple[str, str, Dict[str, Any]]:
+    return "POST", "/questions", {"filename": BENCH_PAPER}
+
+
+ROUTES: Dict[str, Callable[[int], Tuple[str, str, Dict[str, Any]]]] = {
+    "grade_batch": grade_batch_request,
+    "solve_doubt": solve_doubt_request,
+    "generate_planner": planner_request,
+    "questions": questions_request,
+}
+
+
+# ------------------------------
+# Process management
+# ------------------------------
+def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def make_offline_paper() -> str:
+    mirror = tempfile.mkdtemp(prefix="qna_mirror_")
+    os.makedirs(os.path.join(mirror, BENCH_PAPER))
+    fields = [{"question_number": str(i), "type": "descriptive", "marks": 2, "answer": "Sample answer"}
+              for i in range(40)]
+    with open(os.path.join(mirror, BENCH_PAPER, "fields.json"), "w", encoding="utf-8") as f:
+        json.dump(fields, f)
+    return mirror
+
+
+def start_servers(args) -> List[subprocess.Popen]:
+    procs = []
+    fake = [sys.executable, os.path.join(ROOT, "bench", "fake_groq.py"), "--port", str(args.fake_port)]
+    procs.append(subprocess.Popen(fake + shlex.split(args.fake_args), cwd=ROOT))
+    wait_ready(f"http://127.0.0.1:{args.fake_port}/openai/v1/models")
+
+    env = dict(
+        os.environ,
+        GROQ_ENDPOINT=f"http://127.0.0.1:{args.fake_port}/openai/v1/chat/completions",
+        GROQ_API_KEY=os.environ.get("GROQ_API_KEY", "fake-key"),
+        QNA_MIRROR_DIR=make_offline_paper(),
+        QNA_OFFLINE="1",
+    )
+    app = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port),
+           "--workers", str(args.workers), "--log-level", "warning"]
+    procs.append(subprocess.Popen(app, cwd=ROOT, env=env))
+    wait_ready(f"http://127.0.0.1:{args.app_port}/health")
+    return procs
+
+
+# ------------------------------
+# Load generation
+# ------------------------------
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def is_error(status: int, body: bytes) -> bool:
+    if status >= 400:
+        return True
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return True
+    return isinstance(data, dict) and "error" in data
+
+
+async def run_route(client: httpx.AsyncClient, route: str, total: int, concurrency: int) -> Dict[str, Any]:
+    make = ROUTES[route]
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in counter:
+            method, path, body = make(i)
+            start = time.perf_counter()
+            try:
+                resp = await client.request(method, path, json=body)
+                failed = is_error(resp.status_code, resp.content)
+            except httpx.HTTPError:
+                failed = True
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "throughput_rps": round(total / elapsed, 2),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+    }
+
+
+def report(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]) -> None:
+    cols = ["throughput_rps", "error_rate", "p50_ms", "p95_ms", "p99_ms"]
+    print(f"{'route':<18}" + "".join(f"{c:>16}" for c in cols))
+    for route, res in results.items():
+        print(f"{route:<18}" + "".join(f"{res[c]:>16}" for c in cols))
+        if route in baseline:
+            base = baseline[route]
+            deltas = []
+            for c in cols:
+                if base.get(c):
+                    deltas.append(f"{(res[c] - base[c]) / base[c] * 100:>+15.1f}%")
+                else:
+                    deltas.append(f"{'-':>16}")
+            print(f"{'  vs baseline':<18}" + "".join(deltas))
+
+
+async def main_async(args) -> Dict[str, Dict[str, Any]]:
+    base_url = args.target or f"http://127.0.0.1:{args.app_port}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        for route in args.routes.split(","):
+            results[route] = await run_route(client, route.strip(), args.requests, args.concurrency)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the API against a fake Groq server")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma-separated: " + ", ".join(ROUTES))
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--target", default="", help="use an already-running app instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the started app")
+    parser.add_argument("--app-port", type=int, default=8901)
+    parser.add_argument("--fake-port", type=int, default=8900)
+    parser.add_argument("--fake-args", default="", help='extra fake_groq.py args, e.g. "--rate-429 0.1"')
+    parser.add_argument("--save", default="", help="write results JSON here")
+    parser.add_argument("--compare", default="", help="baseline results JSON to compare against")
+    args = parser.parse_args()
+
+    procs = [] if args.target else start_servers(args)
+    try:
+        results = asyncio.run(main_async(args))
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
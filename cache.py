@@ -0,0 +1,237 @@
+"""
+Response caches.
+
+- TTLCache: in-process, size-bounded LRU with per-entry TTL.
+- SQLiteCache: same interface, stored in one SQLite (WAL) file shared by
+  every uvicorn worker on the host, so an answer computed by one worker is
+  a hit for all of them and per-worker memory stays flat. Values must be
+  JSON-serialisable. A small in-process L1 in front of the file serves
+  repeat hits without touching SQLite.
+- make_cache(name, ...) picks the backend from the environment; callers
+  only see get / set / clear / stats. Async code uses aget / aset, which
+  run SQLite reads and writes in a worker thread instead of blocking the
+  event loop.
+- Hit/miss counters (per process) for tuning size and TTL.
+
+Config (environment):
+- CACHE_BACKEND   "memory" (default) or "sqlite"
+- CACHE_DB        SQLite file for the shared backend (default cache.db)
+"""
+
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+def make_key(*parts: Any) -> str:
+    """Stable content hash of JSON-serialisable parts."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        return self.get(key, default)
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self.set(key, value, ttl)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SQLiteCache:
+    """
+    Cross-process cache in a shared SQLite file, one namespace per cache.
+    Expired entries are misses; when a namespace grows past `maxsize` the
+    least recently used entries are evicted (checked every EVICT_EVERY sets).
+    """
+
+    EVICT_EVERY = 64
+    # Recency is only rewritten on a hit when older than this, to keep reads cheap.
+    TOUCH_AFTER = 60.0
+    # In-process L1: entries kept per worker and for how long (bounds staleness across workers)
+    LOCAL_SIZE = 256
+    LOCAL_TTL = 60.0
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 3600.0, path: str = "cache.db"):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._sets = 0
+        self._lock = threading.Lock()
+        self._local = TTLCache(min(maxsize, self.LOCAL_SIZE), min(ttl, self.LOCAL_TTL))
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS cache (
+                   ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,
+                   expires REAL NOT NULL, accessed REAL NOT NULL,
+                   PRIMARY KEY (ns, key))"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (ns, accessed)")
+
+    def _get_local(self, key: Hashable) -> Any:
+        value = self._local.get(key, _MISSING)
+        if value is not _MISSING:
+            with self._lock:
+                self.hits += 1
+        return value
+
+    def _get_shared(self, key: Hashable, default: Any) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires, accessed FROM cache WHERE ns = ? AND key = ?", (self.name, str(key))
+            ).fetchone()
+            if row is None or row[1] < now:
+                self.misses += 1
+                return default
+            if now - row[2] > self.TOUCH_AFTER:
+                self._conn.execute(
+                    "UPDATE cache SET accessed = ? WHERE ns = ? AND key = ?", (now, self.name, str(key)))
+            self.hits += 1
+        value = json.loads(row[0])
+        self._local.set(key, value, min(self._local.ttl, row[1] - now))
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._get_local(key)
+        return self._get_shared(key, default) if value is _MISSING else value
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        """get() for async code: L1 hits inline, SQLite in a worker thread."""
+        value = self._get_local(key)
+        if value is _MISSING:
+            value = await asyncio.to_thread(self._get_shared, key, default)
+        return value
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        now = time.time()
+        self._local.set(key, value, min(self._local.ttl, self.ttl if ttl is None else ttl))
+        raw = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (ns, key, value, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (self.name, str(key), raw, now + (self.ttl if ttl is None else ttl), now),
+            )
+            self._sets += 1
+            if self._sets % self.EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM cache WHERE ns = ? AND expires < ?", (self.name, now))
+        excess = self._count() - self.maxsize
+        if excess > 0:
+            self._conn.execute(
+                """DELETE FROM cache WHERE ns = ? AND key IN (
+                       SELECT key FROM cache WHERE ns = ? ORDER BY accessed LIMIT ?)""",
+                (self.name, self.name, excess),
+            )
+
+    def delete(self, key: Hashable) -> None:
+        self._local.delete(key)
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE ns = ? AND key = ?", (self.name, str(key)))
+
+    def clear(self) -> None:
+        self._local.clear()
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE ns = ?", (self.name,))
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM cache WHERE ns = ?", (self.name,)).fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def make_cache(name: str, maxsize: int = 1024, ttl: float = 3600.0):
+    """Cache named `name` on the configured backend (CACHE_BACKEND)."""
+    if os.getenv("CACHE_BACKEND", "memory").lower() == "sqlite":
+        return SQLiteCache(name, maxsize, ttl, os.getenv("CACHE_DB", "cache.db"))
+    return TTLCache(maxsize, ttl)
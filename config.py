@@ -0,0 +1,45 @@
+"""
+Process-wide configuration bootstrap.
+
+Imported first (by main.py, and by any module that reads the environment at
+import time) so `.env` is loaded exactly once, before module-level config
+constants are evaluated. Also keeps the cold-start timeline: the time this
+module was imported and the time the app finished its startup warm-up.
+"""
+
+from __future__ import annotations
+import time
+from typing import Any, Dict, Optional
+
+IMPORTED_AT = time.perf_counter()
+_ready_at: Optional[float] = None
+_loaded = False
+
+
+def load() -> None:
+    """Load `.env` into the environment (once per process)."""
+    global _loaded
+    if _loaded:
+        return
+    from dotenv import load_dotenv
+    load_dotenv()
+    _loaded = True
+
+
+def mark_ready() -> float:
+    """Record the end of startup; returns seconds since this module was imported."""
+    global _ready_at
+    if _ready_at is None:
+        _ready_at = time.perf_counter()
+    return time_to_ready()
+
+
+def time_to_ready() -> Optional[float]:
+    return None if _ready_at is None else round(_ready_at - IMPORTED_AT, 3)
+
+
+def startup_stats() -> Dict[str, Any]:
+    return {"ready": _ready_at is not None, "time_to_ready": time_to_ready()}
+
+
+load()
@@ -0,0 +1,135 @@
+"""
+Token-budgeted context for multi-turn doubts.
+
+- The most recent turns are kept verbatim, newest first, within the budget.
+- Older turns are folded into a rolling summary cached per conversation:
+  each refresh only summarises the turns that dropped out of the window
+  since the last one (plus the previous summary), and refreshes happen in
+  batches of SUMMARY_BATCH turns, not on every message.
+- If the summary call fails, older turns are cut down locally instead.
+
+Config (environment):
+- DOUBT_CONTEXT_TOKENS   total budget for context (default 1200)
+- DOUBT_RECENT_TURNS     max turns kept verbatim (default 4)
+- DOUBT_SUMMARY_BATCH    dropped turns collected before re-summarising (default 3)
+"""
+
+from __future__ import annotations
+import os
+from typing import List, Tuple
+
+import llm_client
+from cache import make_cache, make_key
+from scheduler import PRIORITY_INTERACTIVE
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("DOUBT_CONTEXT_TOKENS", "1200"))
+RECENT_TURNS = int(os.getenv("DOUBT_RECENT_TURNS", "4"))
+SUMMARY_BATCH = int(os.getenv("DOUBT_SUMMARY_BATCH", "3"))
+SUMMARY_TOKENS = CONTEXT_TOKEN_BUDGET // 4
+SUMMARY_MODEL = "llama-3.1-8b-instant"
+
+# conversation key -> {"turns": n, "fingerprint": hash(turns[:n]), "summary": str}
+_summary_cache = make_cache("context_summaries", maxsize=10000, ttl=6 * 3600)
+
+
+def conversation_key(context: List[str], conversation_id: str = "") -> str:
+    # Without an explicit id, the opening turn identifies the conversation.
+    return conversation_id or make_key("conversation", context[0] if context else "")
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    if llm_client.estimate_tokens(text) <= budget:
+        return text
+    return text[: max(0, budget * 4 - 3)] + "..."
+
+
+def _split_recent(context: List[str], budget: int) -> int:
+    """Index where the verbatim tail starts: up to RECENT_TURNS turns within `budget`."""
+    used = 0
+    split = len(context)
+    while split > 0 and len(context) - split < RECENT_TURNS:
+        cost = llm_client.estimate_tokens(context[split - 1])
+        if used + cost > budget and split < len(context):
+            break
+        used += cost
+        split -= 1
+    return split
+
+
+def _local_summary(previous: str, turns: List[str]) -> str:
+    """Fallback when the LLM summary fails: keep the start of each turn."""
+    per_turn = max(20, SUMMARY_TOKENS // max(1, len(turns) + (1 if previous else 0)))
+    parts = ([truncate_to_tokens(previous, per_turn)] if previous else []) + [
+        truncate_to_tokens(t, per_turn) for t in turns
+    ]
+    return truncate_to_tokens(" | ".join(parts), SUMMARY_TOKENS)
+
+
+async def summarize(previous: str, turns: List[str]) -> str:
+    """Fold `turns` into the previous summary with a small, cheap LLM call."""
+    joined = "\n".join(f"- {t}" for t in turns)
+    prompt = f"""
+Update the running summary of a student's tutoring conversation.
+
+Previous summary:
+{previous or "(none)"}
+
+New messages:
+{joined}
+
+Write at most 5 short bullet points with the topics, the student's confusions and what was already explained.
+Return ONLY the summary.
+"""
+    payload = {
+        "model": SUMMARY_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.2,
+        "max_tokens": SUMMARY_TOKENS,
+    }
+    try:
+        response = await llm_client.post_chat(payload, priority=PRIORITY_INTERACTIVE)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"].strip()
+    except Exception as e:
+        print("Context summary failed, using local fallback:", str(e), flush=True)
+        return _local_summary(previous, turns)
+
+
+async def compact_context(context: List[str], conversation_id: str = "") -> Tuple[str, List[str]]:
+    """
+    Return (summary_of_older_turns, recent_turns_verbatim) whose combined
+    size stays within CONTEXT_TOKEN_BUDGET however long the session is.
+    """
+    if not context:
+        return "", []
+
+    verbatim_budget = CONTEXT_TOKEN_BUDGET - SUMMARY_TOKENS
+    split = _split_recent(context, verbatim_budget)
+    recent = [truncate_to_tokens(t, verbatim_budget) for t in context[split:]]
+    older = context[:split]
+    if not older:
+        return "", recent
+
+    key = conversation_key(context, conversation_id)
+    entry = await _summary_cache.aget(key)
+    if not entry or entry["turns"] > len(older) or entry["fingerprint"] != make_key(older[:entry["turns"]]):
+        entry = {"turns": 0, "fingerprint": make_key([]), "summary": ""}
+
+    pending = older[entry["turns"]:]
+    used = sum(llm_client.estimate_tokens(t) for t in recent)
+    pending_cost = sum(llm_client.estimate_tokens(t) for t in pending)
+    # Few, small dropped turns stay verbatim until a batch worth summarising builds up.
+    if pending and (len(pending) >= SUMMARY_BATCH or used + pending_cost > verbatim_budget):
+        entry = {
+            "turns": len(older),
+            "fingerprint": make_key(older),
+            "summary": await summarize(entry["summary"], pending),
+        }
+        await _summary_cache.aset(key, entry)
+        pending = []
+
+    return truncate_to_tokens(entry["summary"], SUMMARY_TOKENS), pending + recent
+
+
+def cache_stats() -> dict:
+    return _summary_cache.stats()
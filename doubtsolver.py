@@ -1,20 +1,48 @@
-from typing import List
-import requests
+from typing import AsyncIterator, List
+import asyncio
+import json
 import os
+import re
 
-# 🌱 Load environment variables
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+import llm_client
+import metrics
+import retrieval
+import router
+from cache import make_cache, make_key
+from conversation import compact_context
+from scheduler import PRIORITY_INTERACTIVE
 
 # ✅ Replace with models actually available to your account
 LLAMA_MODEL = "llama-3.1-8b-instant"
 DEEPSEEK_MODEL = "deepseek-r1-distill-llama-70b"
 
+# 🗃️ Answer cache for repeat doubts (LRU + TTL, shared across workers with CACHE_BACKEND=sqlite)
+DOUBT_CACHE_SIZE = int(os.getenv("DOUBT_CACHE_SIZE", "2048"))
+DOUBT_CACHE_TTL = float(os.getenv("DOUBT_CACHE_TTL", "86400"))
+_answer_cache = make_cache("doubt_answers", maxsize=DOUBT_CACHE_SIZE, ttl=DOUBT_CACHE_TTL)
 
-def create_prompt(user_prompt: str, context: List[str]) -> str:
-    """Format the prompt with optional context messages."""
-    context_block = ""
-    if context:
-        context_block = "\n".join([f"Previous message: {msg}" for msg in context])
+
+def normalize_prompt(text: str) -> str:
+    """Case/whitespace/trailing-punctuation insensitive form of a doubt."""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip(" ?!.")
+
+
+def cache_key(user_prompt: str, model: str, context: List[str]) -> str:
+    return make_key(model, normalize_prompt(user_prompt), [normalize_prompt(c) for c in context])
+
+
+def cache_stats() -> dict:
+    return _answer_cache.stats()
+
+
+def create_prompt(user_prompt: str, context: List[str], summary: str = "", reference: str = "") -> str:
+    """Format the prompt with optional context messages, a summary of older ones and an official answer."""
+    lines = [f"Summary of earlier conversation: {summary}"] if summary else []
+    lines += [f"Previous message: {msg}" for msg in context]
+    if reference:
+        lines.append(f"📗 Official answer from a past paper (base your explanation on it):\n{reference}")
+    context_block = "\n".join(lines)
 
     return f"""
 You are an expert ICSE doubt explainer.
@@ -33,26 +61,20 @@ Current Doubt:
 """
 
 
-def ask_groq_api(prompt: str, model: str) -> dict:
-    """Send request to Groq API and return response or error details."""
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    payload = {
+def build_payload(prompt: str, model: str) -> dict:
+    return {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.3,
         "max_tokens": 1024
     }
 
+
+async def ask_groq_api(prompt: str, model: str) -> dict:
+    """Send request to Groq API and return response or error details."""
     try:
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
+        # Routed: a slow model is hedged with its faster fallback (see router.py)
+        response = await router.post_chat(build_payload(prompt, model), priority=PRIORITY_INTERACTIVE)
 
         # Debug: if request failed, capture full response body
         if response.status_code != 200:
@@ -65,7 +87,7 @@ def ask_groq_api(prompt: str, model: str) -> dict:
         data = response.json()
 
         return {
-            "model": model,
+            "model": data.get("model") or model,
             "answer": data["choices"][0]["message"]["content"].strip(),
             "tokens_used": data.get("usage", {}).get("total_tokens", 0)
         }
@@ -78,15 +100,133 @@ def ask_groq_api(prompt: str, model: str) -> dict:
         }
 
 
-def solve_doubt(user_prompt: str, important: bool = False, context: List[str] = []) -> dict:
+def _is_error(result: dict) -> bool:
+    return result.get("answer", "").startswith("❌")
+
+
+async def build_prompt(user_prompt: str, context: List[str], conversation_id: str = "", match: dict = None) -> str:
+    """Prompt with the context compacted to a bounded token budget."""
+    summary, recent = await compact_context(context, conversation_id)
+    reference = retrieval.reference_text(match) if match else ""
+    return create_prompt(user_prompt, recent, summary, reference)
+
+
+def lookup_dataset(user_prompt: str, context: List[str], bypass_cache: bool) -> tuple:
+    """
+    Match the doubt against the QnA index. Returns (direct answer or None,
+    match to ground the prompt with or None). Follow-ups (with context) and
+    bypass_cache requests are never answered directly.
+    """
+    match = retrieval.best_match(user_prompt)
+    if match is None:
+        metrics.DOUBT_RETRIEVAL.inc(outcome="miss")
+        return None, None
+    if match["use"] == "direct" and not context and not bypass_cache:
+        metrics.DOUBT_RETRIEVAL.inc(outcome="direct")
+        source = {k: match[k] for k in ("paper", "question_number", "confidence", "question_match")}
+        return {"model": "qna_index", "answer": match["answer"], "tokens_used": 0, "source": source}, None
+    metrics.DOUBT_RETRIEVAL.inc(outcome="grounding")
+    return None, match
+
+
+async def solve_doubt(
+    user_prompt: str,
+    important: bool = False,
+    context: List[str] = [],
+    bypass_cache: bool = False,
+    conversation_id: str = "",
+) -> dict:
     """Main entry: pick model and solve student doubt."""
+    direct, match = lookup_dataset(user_prompt, context, bypass_cache)
+    if direct is not None:
+        return direct
+
     model = DEEPSEEK_MODEL if important else LLAMA_MODEL
-    prompt = create_prompt(user_prompt, context)
-    return ask_groq_api(prompt, model)
+    key = cache_key(user_prompt, model, context)
+    if not bypass_cache:
+        cached = await _answer_cache.aget(key)
+        if cached is not None:
+            return dict(cached)
+
+    prompt = await build_prompt(user_prompt, context, conversation_id, match)
+    result = await ask_groq_api(prompt, model)
+    # A fallback's answer (see router.py) must not be served later as the requested model's.
+    if not _is_error(result) and result["model"] == model:
+        await _answer_cache.aset(key, dict(result))
+    return result
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_groq_api(prompt: str, model: str, key: str = "") -> AsyncIterator[str]:
+    """
+    Stream the answer as SSE: one `token` event per delta, then a final
+    `done` event with `model` and `tokens_used` (or an `error` event).
+    The full answer is stored in the answer cache under `key` if given and
+    the requested model answered (not a hedged fallback).
+    """
+    requested = model
+    tokens_used = 0
+    parts: List[str] = []
+    try:
+        async for chunk in router.stream_chat(build_payload(prompt, model), priority=PRIORITY_INTERACTIVE):
+            model = chunk.get("model") or model
+            choices = chunk.get("choices") or []
+            delta = choices[0].get("delta", {}).get("content") if choices else None
+            if delta:
+                parts.append(delta)
+                yield sse_event("token", {"token": delta})
+            usage = llm_client.chunk_usage(chunk)
+            if usage:
+                tokens_used = usage.get("total_tokens", tokens_used)
+    except Exception as e:
+        yield sse_event("error", {"model": model, "answer": f"❌ Exception: {str(e)}", "tokens_used": 0})
+        return
+
+    if key and model == requested:
+        answer = "".join(parts).strip()
+        await _answer_cache.aset(key, {"model": model, "answer": answer, "tokens_used": tokens_used})
+    yield sse_event("done", {"model": model, "tokens_used": tokens_used})
+
+
+async def _replay_cached(cached: dict) -> AsyncIterator[str]:
+    yield sse_event("token", {"token": cached["answer"]})
+    yield sse_event("done", {"model": cached["model"], "tokens_used": cached["tokens_used"]})
+
+
+async def stream_doubt(
+    user_prompt: str,
+    important: bool = False,
+    context: List[str] = [],
+    bypass_cache: bool = False,
+    conversation_id: str = "",
+) -> AsyncIterator[str]:
+    """Streaming variant of solve_doubt: yields SSE-formatted events."""
+    direct, match = lookup_dataset(user_prompt, context, bypass_cache)
+    if direct is not None:
+        async for event in _replay_cached(direct):
+            yield event
+        return
+
+    model = DEEPSEEK_MODEL if important else LLAMA_MODEL
+    key = cache_key(user_prompt, model, context)
+    if not bypass_cache:
+        cached = await _answer_cache.aget(key)
+        if cached is not None:
+            async for event in _replay_cached(cached):
+                yield event
+            return
+
+    prompt = await build_prompt(user_prompt, context, conversation_id, match)
+    async for event in stream_groq_api(prompt, model, key):
+        yield event
 
 
 # 🧪 Example test
 if __name__ == "__main__":
-    resp = solve_doubt("What is photosynthesis?")
+    resp = asyncio.run(solve_doubt("What is photosynthesis?"))
     print(resp)
 
@@ -1,39 +1,100 @@
-import requests
+import asyncio
 import os
 import json
 import re
-from dotenv import load_dotenv
 
-# Load env vars
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+import config  # loads .env once, before the config below is read
+import llm_client
+from cache import make_cache, make_key
+import llm_json
+import metrics
+import rubric
+from llm_json import ArrayObjectStreamer
+from local_grader import grade_locally
+from scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE
+
 GROQ_MODEL = "llama-3.1-8b-instant"
 
-def extract_json(text):
-    match = re.search(r"\{[\s\S]*\}", text)
-    if match:
-        return match.group(0)
-    else:
-        raise ValueError("No valid JSON object found.")
+# Sharding: per-shard token budget (question text + expected evaluation output)
+SHARD_TOKEN_BUDGET = int(os.getenv("GRADE_SHARD_TOKENS", "2500"))
+OUTPUT_TOKENS_PER_QUESTION = int(os.getenv("GRADE_OUTPUT_TOKENS_PER_QUESTION", "250"))
+# Marks-only mode: verdict + marks per question, no feedback text
+MARKS_TOKENS_PER_QUESTION = int(os.getenv("GRADE_MARKS_TOKENS_PER_QUESTION", "40"))
+
+# Per-question memo of LLM evaluations, shared by every student taking the paper
+GRADE_CACHE_SIZE = int(os.getenv("GRADE_CACHE_SIZE", "20000"))
+GRADE_CACHE_TTL = float(os.getenv("GRADE_CACHE_TTL", "604800"))
+_evaluation_cache = make_cache("grading", maxsize=GRADE_CACHE_SIZE, ttl=GRADE_CACHE_TTL)
+
+
+def evaluation_key(item: dict) -> str:
+    """Content address of a graded item: same question + same answer → same evaluation."""
+    return make_key(
+        GROQ_MODEL,
+        str(item.get("question_number", "")),
+        item.get("type", ""),
+        item.get("marks", 0),
+        item.get("correct_answer", ""),
+        re.sub(r"\s+", " ", (item.get("user_answer") or "").strip()),
+    )
+
 
-def evaluate_answer_batch(batch: list) -> str:
+def marks_key(item: dict) -> str:
+    """Cache key of a marks-only evaluation (a full evaluation also answers it)."""
+    return make_key("marks", evaluation_key(item))
+
+
+def cache_stats() -> dict:
+    return _evaluation_cache.stats()
+
+def extract_json(text):
     """
-    Batch grading where each item already contains:
-    question_number, type, marks, correct_answer, user_answer
+    Repaired JSON text of the first object in the LLM output. When the
+    output was cut off, evaluations it did not finish are tagged "truncated".
     """
+    try:
+        result = llm_json.extract_json(text)
+    except ValueError:
+        metrics.JSON_PARSE_FAILURES.inc(source="grader")
+        raise
+    for repair in result.repairs:
+        metrics.JSON_REPAIRS.inc(source="grader", repair=repair)
+    if result.repairs:
+        print("Repaired grader JSON:", ", ".join(result.repairs), flush=True)
+    if "closed truncated output" in result.repairs:
+        return _tag_truncated(text, result.value)
+    return result.text
 
-    prompt_sections = []
-    total_possible = 0
 
-    for item in batch:
-        qnum = item.get("question_number", "")
-        qtype = item.get("type", "")
-        marks = item.get("marks", 0)
-        total_possible += marks
-        correct_answer = item.get("correct_answer", "")
-        user_answer = item.get("user_answer", "")
-
-        prompt_sections.append(f"""
+def _tag_truncated(text: str, value) -> str:
+    """Mark evaluations past the last one whose object was closed in `text`."""
+    evaluations = value.get("evaluations") if isinstance(value, dict) else None
+    if isinstance(evaluations, list):
+        complete = len(ArrayObjectStreamer("evaluations").feed(text))
+        for ev in evaluations[complete:]:
+            if isinstance(ev, dict):
+                ev["truncated"] = True
+    return json.dumps(value, ensure_ascii=False)
+
+def question_block(item: dict) -> str:
+    qnum = item.get("question_number", "")
+    qtype = item.get("type", "")
+    marks = item.get("marks", 0)
+    correct_answer = item.get("correct_answer", "")
+    user_answer = item.get("user_answer", "")
+    # Marks fixed by an earlier marks-only pass: feedback must explain them, not change them
+    awarded = f"\n🎯 Marks already awarded: {item['awarded']} (keep them; explain why)" if "awarded" in item else ""
+
+    if item.get("rubric"):
+        return f"""
+📘 Question Number: {qnum}
+🧠 Question Type: {qtype}
+🔢 Total Marks: {marks}
+{rubric.rubric_lines(item["rubric"])}
+✍️ Student Answer: {user_answer}{awarded}
+"""
+
+    return f"""
 --------------------------
 
 📘 Question Number: {qnum}
@@ -44,10 +105,46 @@ def evaluate_answer_batch(batch: list) -> str:
 {correct_answer}
 
 ✍️ **Student Answer**:  
-{user_answer}
-""")
+{user_answer}{awarded}
+"""
+
+
+def build_rubric_prompt(batch: list) -> str:
+    """Short examiner prompt for items that all carry a precompiled rubric."""
+    total_possible = sum(item.get("marks", 0) for item in batch)
+    question_blocks = "".join(question_block(item) for item in batch)
+    return f"""
+You are an ICSE Class 10 Physics board examiner. Grade each answer against its rubric ONLY.
+- Key values: equal share of marks per value; correct if within 0.005 (≤10) or 0.01 (>10) with equivalent units.
+- Key concepts: equal share per concept whose meaning is present (synonyms fine; extra text only costs marks if it contradicts).
+- Correct option: all or nothing. Diagram: always full marks.
+Feedback must be useful: where the student went wrong, the chapter to revise, and how to fix it.
+Return ONLY this JSON, nothing outside it:
+{{"evaluations": [{{"question_number": "", "type": "", "verdict": "", "marks_awarded": 0, "total_marks": 0, "mistake": "", "correct_answer": [], "mistake_type": "", "feedback": ""}}], "total_marks_awarded": <sum>, "total_marks_possible": {total_possible}}}
+{question_blocks}"""
+
+
+def build_marks_prompt(batch: list) -> str:
+    """Marks-only examiner prompt: verdict and marks per question, no feedback."""
+    question_blocks = "".join(question_block(item) for item in batch)
+    return f"""
+You are an ICSE Class 10 Physics board examiner. Award marks only, no feedback or explanations.
+- Numerical: equal share of marks per required value; correct if within 0.005 (≤10) or 0.01 (>10) with equivalent units.
+- Descriptive: equal share per key concept of the answer key whose meaning is present (synonyms fine).
+- MCQ: all or nothing. Diagram: always full marks.
+Return ONLY this JSON, nothing outside it:
+{{"evaluations": [{{"question_number": "", "verdict": "correct | partially correct | incorrect", "marks_awarded": 0}}]}}
+{question_blocks}"""
+
 
-    question_blocks = "\n".join(prompt_sections)
+def build_grading_prompt(batch: list, marks_only: bool = False) -> str:
+    """Examiner prompt for the given items (only the ones the LLM must grade)."""
+    if marks_only:
+        return build_marks_prompt(batch)
+    if batch and all(item.get("rubric") for item in batch):
+        return build_rubric_prompt(batch)
+    total_possible = sum(item.get("marks", 0) for item in batch)
+    question_blocks = "\n".join(question_block(item) for item in batch)
 
     full_prompt = f"""
 You are an ICSE Class 10 Physics board examiner.
@@ -111,26 +208,312 @@ RETURN THE JSON ONLY. NOTHING ELSE. I REPEAT NOTHING ELSE. NO TEXT LIKE "HERES Y
 Now evaluate these answers:
 {question_blocks}
 """
+    return full_prompt
 
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json"
-    }
 
-    payload = {
+def grading_payload(batch: list, marks_only: bool = False) -> dict:
+    return {
         "model": GROQ_MODEL,
-        "messages": [{"role": "user", "content": full_prompt}],
+        "messages": [{"role": "user", "content": build_grading_prompt(batch, marks_only)}],
         "temperature": 0.2,
-        "max_tokens": 5000
+        "max_tokens": min(5000, 100 + MARKS_TOKENS_PER_QUESTION * len(batch)) if marks_only else 5000
     }
 
+
+async def grade_with_llm(batch: list, marks_only: bool = False, priority: int = PRIORITY_BULK) -> str:
+    """Send the items to the LLM; returns the JSON string or an error string."""
+    payload = grading_payload(batch, marks_only)
+
+    response = None
     try:
-        response = requests.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=payload)
+        response = await llm_client.post_chat(payload, priority=priority)
         response.raise_for_status()
         return extract_json(response.json()["choices"][0]["message"]["content"]).strip()
     except Exception as e:
-        return f"❌ Error: {str(e)}\n\n{response.text}"
+        body = response.text if response is not None else ""
+        return f"❌ Error: {str(e)}\n\n{body}"
+
+
+def align_evaluations(items: list, evaluations: list) -> tuple:
+    """
+    Pair each item with the LLM evaluation carrying its question_number
+    (None if the LLM skipped it). Also returns evaluations left unmatched.
+    """
+    by_number = {}
+    for ev in evaluations:
+        by_number.setdefault(str(ev.get("question_number", "")), []).append(ev)
+    used = set()
+
+    paired = []
+    for item in items:
+        matches = by_number.get(str(item.get("question_number", "")))
+        ev = matches.pop(0) if matches else None
+        if ev is not None:
+            used.add(id(ev))
+        paired.append(ev)
+    leftovers = [ev for ev in evaluations if id(ev) not in used]
+    return paired, leftovers
+
+
+def merge_evaluations(batch: list, decided: dict, llm_evaluations: list) -> dict:
+    """
+    Combine items decided without the LLM (local rules or cache, by batch
+    index) with LLM evaluations into the original question order,
+    recomputing totals locally. Questions the LLM never returned (e.g. cut
+    off at max_tokens) are listed under "missing", as in the stream totals.
+    """
+    pending = [item for i, item in enumerate(batch) if i not in decided]
+    paired, leftovers = align_evaluations(pending, llm_evaluations)
+    paired_iter = iter(paired)
+
+    evaluations, missing = [], []
+    for i, item in enumerate(batch):
+        ev = decided[i] if i in decided else next(paired_iter)
+        if ev is not None:
+            evaluations.append(ev)
+        else:
+            missing.append(item.get("question_number", ""))
+    # Anything the LLM returned that we couldn't line up is kept as-is.
+    evaluations.extend(leftovers)
+
+    merged = {
+        "evaluations": evaluations,
+        "total_marks_awarded": sum_marks(evaluations),
+        "total_marks_possible": sum(item.get("marks", 0) for item in batch),
+    }
+    if missing:
+        merged["missing"] = missing
+    return merged
+
+
+def sum_marks(evaluations: list):
+    total_awarded = 0
+    for ev in evaluations:
+        try:
+            total_awarded += float(ev.get("marks_awarded", 0) or 0)
+        except (TypeError, ValueError):
+            pass
+    total_awarded = round(total_awarded, 2)
+    if total_awarded == int(total_awarded):
+        total_awarded = int(total_awarded)
+    return total_awarded
+
+
+def shard_batch(batch: list, budget: int = SHARD_TOKEN_BUDGET, marks_only: bool = False) -> list:
+    """
+    Split items into consecutive shards whose estimated size (question block
+    plus expected evaluation output) stays within `budget` tokens.
+    A single oversized item still gets a shard of its own.
+    """
+    shards, current, used = [], [], 0
+    output = MARKS_TOKENS_PER_QUESTION if marks_only else OUTPUT_TOKENS_PER_QUESTION
+    for item in batch:
+        cost = llm_client.estimate_tokens(question_block(item)) + output
+        if current and used + cost > budget:
+            shards.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        shards.append(current)
+    return shards
+
+
+async def split_decided(batch: list, marks_only: bool = False) -> tuple:
+    """
+    Grade what we can without the LLM (local rules, then the per-question
+    cache). Returns ({batch index: evaluation}, items left for the LLM).
+    """
+    decided = {}
+    llm_items = []
+    for i, item in enumerate(batch):
+        evaluation = grade_locally(item)
+        if evaluation is None:
+            evaluation = await _evaluation_cache.aget(evaluation_key(item))
+            if evaluation is None and marks_only:
+                evaluation = await _evaluation_cache.aget(marks_key(item))
+            if evaluation is not None:
+                evaluation = dict(evaluation)
+        if evaluation is None:
+            llm_items.append(item)
+        else:
+            decided[i] = evaluation
+    return decided, llm_items
+
+
+async def _remember(items: list, evaluations: list, marks_only: bool = False) -> None:
+    paired, _ = align_evaluations(items, evaluations)
+    for item, ev in zip(items, paired):
+        # A cut-off evaluation (partial feedback) is never shared with other students.
+        if isinstance(ev, dict) and "marks_awarded" in ev and not ev.get("truncated"):
+            await _evaluation_cache.aset(marks_key(item) if marks_only else evaluation_key(item), dict(ev))
+
+
+def complete_marks_only(items: list, evaluations: list) -> None:
+    """Fill type / total_marks into minimal marks-only evaluations from their items."""
+    paired, _ = align_evaluations(items, evaluations)
+    for item, ev in zip(items, paired):
+        if isinstance(ev, dict):
+            ev.setdefault("type", item.get("type", ""))
+            ev.setdefault("total_marks", item.get("marks", 0))
+
+
+async def with_rubrics(items: list, paper: str) -> list:
+    """Attach the paper's precompiled rubrics (compiled off the event loop on first use)."""
+    if not paper or not items:
+        return items
+    return await asyncio.to_thread(rubric.attach, items, paper)
+
+
+async def evaluate_answer_batch(batch: list, shard: bool = False, paper: str = "", marks_only: bool = False) -> str:
+    """
+    Batch grading where each item already contains:
+    question_number, type, marks, correct_answer, user_answer
+
+    MCQ, numerical and diagram items are graded by the local rule engine;
+    descriptive or undecidable items are looked up in the per-question
+    cache, and only the misses are sent to the LLM. With `shard=True`
+    those are split by token budget and graded concurrently. With `paper`,
+    the LLM gets the paper's compact rubrics instead of the full answer keys.
+    With `marks_only`, the LLM returns just verdicts and marks (feedback is
+    fetched per question later, see question_feedback).
+    A shard that fails leaves its questions under "missing" and its error
+    under "errors"; the other shards' evaluations are kept (and cached).
+    """
+    decided, llm_items = await split_decided(batch, marks_only)
+    llm_items = await with_rubrics(llm_items, paper)
+
+    llm_evaluations, errors = [], []
+    if llm_items:
+        shards = shard_batch(llm_items, marks_only=marks_only) if shard else [llm_items]
+        results = await asyncio.gather(*(grade_with_llm(s, marks_only) for s in shards))
+        for result_str in results:
+            try:
+                llm_evaluations.extend(json.loads(result_str).get("evaluations", []))
+            except (json.JSONDecodeError, AttributeError):
+                errors.append(result_str)
+        if len(errors) == len(shards):
+            return errors[0]  # nothing graded: error string surfaced by the caller
+
+        if marks_only:
+            complete_marks_only(llm_items, llm_evaluations)
+        await _remember(llm_items, llm_evaluations, marks_only)
+
+    merged = merge_evaluations(batch, decided, llm_evaluations)
+    if errors:
+        merged["errors"] = errors
+    return json.dumps(merged, ensure_ascii=False)
+
+
+async def _stream_shard(items: list, queue: asyncio.Queue, marks_only: bool = False) -> None:
+    """Stream one shard's grading and put each evaluation on `queue` as it closes."""
+    streamer = ArrayObjectStreamer("evaluations")
+    expected = [str(item.get("question_number", "")) for item in items]
+    received = []
+    try:
+        async for chunk in llm_client.stream_chat(grading_payload(items, marks_only)):
+            choices = chunk.get("choices") or []
+            delta = choices[0].get("delta", {}).get("content") if choices else None
+            if not delta:
+                continue
+            for ev in streamer.feed(delta):
+                number = str(ev.get("question_number", ""))
+                if number not in expected:
+                    continue  # not asked for (or a duplicate): would skew the totals
+                expected.remove(number)
+                received.append(ev)
+                if marks_only:
+                    complete_marks_only(items, [ev])
+                await _remember(items, [ev], marks_only)
+                await queue.put(("evaluation", ev))
+    except Exception as e:
+        await queue.put(("error", f"❌ Error: {str(e)}"))
+    finally:
+        if streamer.errors:
+            metrics.JSON_PARSE_FAILURES.inc(streamer.errors, source="grader_stream")
+        paired, _ = align_evaluations(items, received)
+        missing = [item.get("question_number", "") for item, ev in zip(items, paired) if ev is None]
+        await queue.put(("done", missing))
 
 
+async def stream_answer_batch(batch: list, shard: bool = False, paper: str = "", marks_only: bool = False):
+    """
+    NDJSON variant of evaluate_answer_batch: yields one line per evaluation
+    as soon as it is decided (local/cached ones first, then each LLM object
+    as it closes in the token stream) and a final totals line.
+    """
+    decided, llm_items = await split_decided(batch, marks_only)
+    llm_items = await with_rubrics(llm_items, paper)
+    evaluations = []
+    for i in sorted(decided):
+        evaluations.append(decided[i])
+        yield json.dumps(decided[i], ensure_ascii=False) + "\n"
+
+    missing, errors = [], []
+    if llm_items:
+        shards = shard_batch(llm_items, marks_only=marks_only) if shard else [llm_items]
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks = [asyncio.create_task(_stream_shard(s, queue, marks_only)) for s in shards]
+        pending = len(tasks)
+        try:
+            while pending:
+                kind, value = await queue.get()
+                if kind == "evaluation":
+                    evaluations.append(value)
+                    yield json.dumps(value, ensure_ascii=False) + "\n"
+                elif kind == "error":
+                    errors.append(value)
+                else:
+                    missing.extend(value)
+                    pending -= 1
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    totals = {
+        "total_marks_awarded": sum_marks(evaluations),
+        "total_marks_possible": sum(item.get("marks", 0) for item in batch),
+    }
+    if missing:
+        totals["missing"] = missing
+    if errors:
+        totals["errors"] = errors
+    yield json.dumps(totals, ensure_ascii=False) + "\n"
+
 
+async def question_feedback(item: dict, marks_awarded=None, paper: str = "") -> dict:
+    """
+    Full evaluation (mistake, correct answer, feedback) for one question,
+    e.g. after a marks-only pass. Marks from that pass (given, or found in
+    the cache) are kept and explained. Only evaluations whose marks came
+    from our own grading are cached: client-supplied marks never reach the
+    shared per-question cache.
+    """
+    if marks_awarded is not None and not 0 <= marks_awarded <= item.get("marks", 0):
+        return {"error": "marks_awarded must be between 0 and the question's marks"}
+
+    evaluation = grade_locally(item) or await _evaluation_cache.aget(evaluation_key(item))
+    if evaluation is not None:
+        return dict(evaluation)
 
+    client_marks = marks_awarded is not None
+    if marks_awarded is None:
+        earlier = await _evaluation_cache.aget(marks_key(item))
+        marks_awarded = earlier.get("marks_awarded") if earlier else None
+    request = dict(item, awarded=marks_awarded) if marks_awarded is not None else item
+    items = await with_rubrics([request], paper)
+
+    result_str = await grade_with_llm(items, priority=PRIORITY_INTERACTIVE)
+    try:
+        evaluations = json.loads(result_str).get("evaluations", [])
+    except (json.JSONDecodeError, AttributeError):
+        return {"error": "Feedback generation failed", "details": result_str}
+    paired, _ = align_evaluations(items, evaluations)
+    evaluation = paired[0] if paired[0] is not None else (evaluations[0] if evaluations else None)
+    if not isinstance(evaluation, dict):
+        return {"error": "Feedback generation failed", "details": result_str}
+    if marks_awarded is not None:
+        evaluation["marks_awarded"] = marks_awarded
+    if not client_marks and not evaluation.get("truncated"):
+        await _evaluation_cache.aset(evaluation_key(item), dict(evaluation))
+    return evaluation
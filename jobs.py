@@ -0,0 +1,287 @@
+"""
+Bulk grading jobs: a whole class's answer sheets graded in the background.
+
+- submit() stores the sheets in SQLite and returns a job id immediately.
+- A bounded pool of worker tasks claims pending sheets one at a time and
+  grades them with grader.evaluate_answer_batch, so at most GRADING_WORKERS
+  sheets are in flight per process.
+- State lives in SQLite (WAL), so jobs survive a restart and several app
+  processes can share one store: claiming a sheet is an atomic update, and
+  a sheet whose worker died is picked up again once its lease expires.
+
+Config (environment):
+- GRADING_JOBS_DB       SQLite file (default grading_jobs.db)
+- GRADING_WORKERS       concurrent sheets per process (default 4)
+- GRADING_LEASE         seconds before a claimed, unfinished sheet is retried (default 600)
+- GRADING_POLL          seconds between store polls when idle (default 1)
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import grader
+
+JOBS_DB = os.getenv("GRADING_JOBS_DB", "grading_jobs.db")
+WORKERS = int(os.getenv("GRADING_WORKERS", "4"))
+LEASE_SECONDS = float(os.getenv("GRADING_LEASE", "600"))
+POLL_SECONDS = float(os.getenv("GRADING_POLL", "1"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    shard INTEGER NOT NULL DEFAULT 0,
+    paper TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    student_id TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'pending',   -- pending | running | done | failed
+    questions TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    claimed_at REAL,
+    finished_at REAL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS sheets_status ON sheets (status, claimed_at);
+"""
+
+
+# ------------------------------
+# Store
+# ------------------------------
+class JobStore:
+    """SQLite-backed job/sheet state. Methods are blocking; call them via asyncio.to_thread."""
+
+    def __init__(self, path: str = JOBS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        try:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN paper TEXT NOT NULL DEFAULT ''")
+        except sqlite3.OperationalError:
+            pass  # created with the column, or already migrated
+
+    def create(self, sheets: List[Dict[str, Any]], shard: bool = False, paper: str = "") -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT INTO jobs (id, created, shard, paper) VALUES (?, ?, ?, ?)",
+                                   (job_id, time.time(), int(shard), paper))
+                self._conn.executemany(
+                    "INSERT INTO sheets (job_id, idx, student_id, questions) VALUES (?, ?, ?, ?)",
+                    [(job_id, i, s.get("student_id", ""), json.dumps(s["questions"], ensure_ascii=False))
+                     for i, s in enumerate(sheets)],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def claim(self) -> Optional[Tuple[str, int, List[Dict[str, Any]], bool, str]]:
+        """Atomically take the oldest pending (or lease-expired) sheet."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    """SELECT s.job_id, s.idx, s.questions, j.shard, j.paper FROM sheets s JOIN jobs j ON j.id = s.job_id
+                       WHERE s.status = 'pending' OR (s.status = 'running' AND s.claimed_at < ?)
+                       ORDER BY j.created, s.idx LIMIT 1""",
+                    (now - LEASE_SECONDS,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE sheets SET status = 'running', claimed_at = ? WHERE job_id = ? AND idx = ?",
+                        (now, row[0], row[1]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2]), bool(row[3]), row[4]
+
+    def finish(self, job_id: str, idx: int, result: Optional[Dict[str, Any]] = None, error: str = "") -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sheets SET status = ?, result = ?, error = ?, finished_at = ? WHERE job_id = ? AND idx = ?",
+                ("failed" if error else "done", json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error or None, time.time(), job_id, idx),
+            )
+
+    def release(self, job_id: str, idx: int) -> None:
+        """Put a claimed sheet back (worker stopped before finishing it)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sheets SET status = 'pending', claimed_at = NULL WHERE job_id = ? AND idx = ? AND status = 'running'",
+                (job_id, idx),
+            )
+
+    def progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._conn.execute("SELECT created FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM sheets WHERE job_id = ? GROUP BY status", (job_id,)).fetchall())
+        total = sum(counts.values())
+        finished = counts.get("done", 0) + counts.get("failed", 0)
+        return {
+            "job_id": job_id,
+            "status": "completed" if finished == total else ("running" if finished or counts.get("running") else "queued"),
+            "total": total,
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "pending": counts.get("pending", 0) + counts.get("running", 0),
+            "created": job[0],
+        }
+
+    def results(self, job_id: str, after: float = 0.0) -> List[Dict[str, Any]]:
+        """Finished sheets, in finishing order; `after` limits to those finished since then (inclusive)."""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT idx, student_id, status, result, error, finished_at FROM sheets
+                   WHERE job_id = ? AND status IN ('done', 'failed') AND finished_at >= ?
+                   ORDER BY finished_at, idx""",
+                (job_id, after),
+            ).fetchall()
+        return [
+            {
+                "index": idx,
+                "student_id": student,
+                "status": status,
+                "result": json.loads(result) if result else None,
+                "error": error,
+                "finished_at": finished,
+            }
+            for idx, student, status, result, error, finished in rows
+        ]
+
+
+_store: Optional[JobStore] = None
+
+
+def get_store() -> JobStore:
+    global _store
+    if _store is None:
+        _store = JobStore()
+    return _store
+
+
+# ------------------------------
+# Worker pool
+# ------------------------------
+_workers: List[asyncio.Task] = []
+_wakeup: Optional[asyncio.Event] = None
+
+
+async def grade_sheet(questions: List[Dict[str, Any]], shard: bool,
+                      paper: str = "") -> Tuple[Optional[Dict[str, Any]], str]:
+    """(result, "") on success, (None, error) otherwise."""
+    try:
+        result_str = await grader.evaluate_answer_batch(questions, shard=shard, paper=paper)
+        return json.loads(result_str), ""
+    except json.JSONDecodeError:
+        return None, result_str  # grader's error string
+    except Exception as e:
+        return None, f"❌ Error: {str(e)}"
+
+
+async def _worker() -> None:
+    store = get_store()
+    while True:
+        try:
+            claimed = await asyncio.to_thread(store.claim)
+        except sqlite3.Error as e:
+            print("Grading job store error:", str(e), flush=True)
+            claimed = None
+        if claimed is None:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        job_id, idx, questions, shard, paper = claimed
+        try:
+            result, error = await grade_sheet(questions, shard, paper)
+        except asyncio.CancelledError:
+            store.release(job_id, idx)  # shutting down: resume right after restart
+            raise
+        try:
+            await asyncio.to_thread(store.finish, job_id, idx, result, error)
+        except sqlite3.Error as e:
+            # Left "running": the sheet is graded again once its lease expires.
+            print("Grading job store error:", str(e), flush=True)
+
+
+def start_workers(count: int = WORKERS) -> None:
+    """Start the pool (app startup). Unfinished sheets from before a restart are resumed."""
+    global _wakeup
+    if _workers:
+        return
+    _wakeup = asyncio.Event()
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(count))
+
+
+async def stop_workers() -> None:
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+# ------------------------------
+# API helpers
+# ------------------------------
+async def submit(sheets: List[Dict[str, Any]], shard: bool = False, paper: str = "") -> Dict[str, Any]:
+    job_id = await asyncio.to_thread(get_store().create, sheets, shard, paper)
+    if _wakeup is not None:
+        _wakeup.set()
+    return {"job_id": job_id, "total": len(sheets)}
+
+
+async def progress(job_id: str) -> Optional[Dict[str, Any]]:
+    return await asyncio.to_thread(get_store().progress, job_id)
+
+
+async def results(job_id: str) -> Optional[Dict[str, Any]]:
+    status = await progress(job_id)
+    if status is None:
+        return None
+    status["sheets"] = sorted(await asyncio.to_thread(get_store().results, job_id), key=lambda s: s["index"])
+    return status
+
+
+async def stream_progress(job_id: str):
+    """NDJSON: one line per sheet as it finishes, then a final progress line."""
+    store = get_store()
+    after = 0.0
+    seen = set()
+    while True:
+        status = await asyncio.to_thread(store.progress, job_id)
+        for sheet in await asyncio.to_thread(store.results, job_id, after):
+            if sheet["index"] in seen:
+                continue
+            seen.add(sheet["index"])
+            after = max(after, sheet["finished_at"])
+            yield json.dumps(sheet, ensure_ascii=False) + "\n"
+        if status is None or status["status"] == "completed":
+            yield json.dumps(status or {"error": "Job not found"}) + "\n"
+            return
+        await asyncio.sleep(POLL_SECONDS)
@@ -0,0 +1,322 @@
+"""
+Shared async Groq client.
+
+- One pooled httpx.AsyncClient is reused by grader, doubtsolver and planner,
+  so LLM calls share keep-alive connections instead of paying a fresh TLS
+  handshake each time.
+- Calls are async, so a single uvicorn worker can keep hundreds of LLM
+  requests in flight without tying up threadpool workers.
+- Identical payloads that arrive while one is already in flight share that
+  call's response (single-flight) instead of spending quota twice.
+- Every call goes through the priority scheduler (per-model token buckets)
+  and is retried with backoff on 429/503, honouring retry-after.
+- Each HTTP attempt's latency and the reported token usage are recorded
+  in metrics (per model).
+- Inside an admitted request, the scheduler wait, HTTP timeouts and retry
+  sleeps are capped by the request's deadline (see admission.py).
+
+Config (environment):
+- GROQ_API_KEY
+- GROQ_ENDPOINT             chat completions URL (default: Groq's)
+- GROQ_MAX_CONNECTIONS      (default 200)
+- GROQ_MAX_KEEPALIVE        (default 50)
+- GROQ_KEEPALIVE_EXPIRY     seconds (default 30)
+- GROQ_CONNECT_TIMEOUT      seconds (default 5)
+- GROQ_TIMEOUT              seconds (default 60)
+- GROQ_HTTP2                "1" to enable HTTP/2 (needs the `h2` package)
+- GROQ_MAX_RETRIES          retries when throttled (default 4)
+- GROQ_BACKOFF_BASE         first backoff in seconds (default 0.5)
+- GROQ_PREWARM_CONNECTIONS  connections opened at startup (default 4, 0 = off)
+- GROQ_PREWARM_WAIT         longest startup wait for them, in seconds (default 1)
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+import admission
+import config  # loads .env once, before the config below is read
+import metrics
+from cache import make_key
+from scheduler import LLMScheduler, PRIORITY_BULK
+from singleflight import SingleFlight
+
+
+# ------------------------------
+# Config
+# ------------------------------
+# Overridable so benchmarks can point at a local stand-in (bench/fake_groq.py)
+GROQ_ENDPOINT = os.getenv("GROQ_ENDPOINT", "https://api.groq.com/openai/v1/chat/completions")
+
+MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "200"))
+MAX_KEEPALIVE = int(os.getenv("GROQ_MAX_KEEPALIVE", "50"))
+KEEPALIVE_EXPIRY = float(os.getenv("GROQ_KEEPALIVE_EXPIRY", "30"))
+CONNECT_TIMEOUT = float(os.getenv("GROQ_CONNECT_TIMEOUT", "5"))
+REQUEST_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+USE_HTTP2 = os.getenv("GROQ_HTTP2", "0") == "1"
+MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("GROQ_BACKOFF_BASE", "0.5"))
+RETRY_STATUSES = (429, 503)
+# Share of max_tokens assumed to be generated, for up-front bucket debits
+COMPLETION_ESTIMATE_RATIO = 0.5
+PREWARM_CONNECTIONS = int(os.getenv("GROQ_PREWARM_CONNECTIONS", "4"))
+PREWARM_WAIT = float(os.getenv("GROQ_PREWARM_WAIT", "1"))
+
+_client: Optional[httpx.AsyncClient] = None
+_singleflight = SingleFlight()
+_prewarming: set = set()  # warm-up requests still running after startup stopped waiting
+scheduler = LLMScheduler.from_env()
+
+
+# ------------------------------
+# Client lifecycle
+# ------------------------------
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=USE_HTTP2 and _http2_available(),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+async def warm_up(connections: int = PREWARM_CONNECTIONS, wait: float = PREWARM_WAIT) -> int:
+    """
+    Open `connections` pooled keep-alive connections to the LLM host (DNS,
+    TCP and TLS done up front) with cheap GETs on the models endpoint.
+    Waits at most `wait` seconds, so a slow or unreachable host never holds
+    up startup; slower connections keep warming in the background.
+    Returns how many succeeded in time; failures only mean a cold first request.
+    """
+    if connections <= 0:
+        return 0
+    url = GROQ_ENDPOINT.rsplit("/chat/completions", 1)[0] + "/models"
+
+    async def touch() -> bool:
+        try:
+            response = await get_client().get(url, headers=_headers(), timeout=CONNECT_TIMEOUT * 2)
+            await response.aclose()
+            return True
+        except Exception:  # warm-up must never fail startup
+            return False
+
+    # Concurrent, so each request needs its own connection.
+    tasks = [asyncio.ensure_future(touch()) for _ in range(min(connections, MAX_KEEPALIVE))]
+    done, pending = await asyncio.wait(tasks, timeout=wait)
+    for task in pending:
+        _prewarming.add(task)
+        task.add_done_callback(_prewarming.discard)
+    return sum(task.result() for task in done)
+
+
+async def close_client() -> None:
+    """Close the pooled client (called on app shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+# ------------------------------
+# API Call
+# ------------------------------
+def api_key() -> Optional[str]:
+    # Read at call time so it does not depend on which module ran load_dotenv().
+    return os.getenv("GROQ_API_KEY")
+
+
+def _headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {api_key()}",
+        "Content-Type": "application/json",
+    }
+
+
+def _http_timeout(timeout: Optional[float]) -> httpx.Timeout:
+    """Per-call timeout, capped by the current request's deadline."""
+    total = admission.cap_timeout(REQUEST_TIMEOUT if timeout is None else timeout)
+    return httpx.Timeout(total, connect=min(CONNECT_TIMEOUT, total))
+
+
+def payload_token_estimate(payload: Dict[str, Any]) -> int:
+    prompt = "".join(str(m.get("content", "")) for m in payload.get("messages", []))
+    return estimate_tokens(prompt) + int(payload.get("max_tokens", 1024) * COMPLETION_ESTIMATE_RATIO)
+
+
+def retry_delay(response: httpx.Response, attempt: int) -> float:
+    """retry-after (seconds or HTTP date) if given, else exponential backoff with jitter."""
+    backoff = BACKOFF_BASE * (2 ** attempt) * (1 + random.random() * 0.25)
+    header = response.headers.get("retry-after")
+    if header:
+        try:
+            return max(float(header), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(header).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    return backoff
+
+
+async def _scheduled(send, payload: Dict[str, Any], priority: int):
+    """
+    Run `send()` (which returns a response) under the scheduler, retrying
+    while Groq throttles us. Returns the last response.
+    """
+    model = payload.get("model", "")
+    estimate = payload_token_estimate(payload)
+    for attempt in range(MAX_RETRIES + 1):
+        await admission.within_deadline(scheduler.acquire(model, estimate, priority))
+        started = time.perf_counter()
+        try:
+            response = await admission.within_deadline(send())
+        except Exception as e:
+            metrics.LLM_LATENCY.observe(time.perf_counter() - started, model=model, status=type(e).__name__)
+            raise
+        metrics.LLM_LATENCY.observe(time.perf_counter() - started, model=model, status=str(response.status_code))
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            return response, estimate
+        delay = retry_delay(response, attempt)
+        left = admission.remaining()
+        if left is not None and delay >= left:
+            scheduler.penalize(model, delay)
+            return response, estimate  # no time left to wait it out: surface the 429
+        # Throttled requests don't use quota: refund, pause the model, back off.
+        scheduler.reconcile(model, estimate, 0)
+        scheduler.penalize(model, delay)
+        await response.aclose()
+        await asyncio.sleep(delay)
+
+
+def record_usage(model: str, usage: Optional[Dict[str, Any]]) -> None:
+    """Count prompt/completion tokens reported by Groq."""
+    if not usage:
+        return
+    metrics.LLM_PROMPT_TOKENS.inc(usage.get("prompt_tokens", 0), model=model)
+    metrics.LLM_COMPLETION_TOKENS.inc(usage.get("completion_tokens", 0), model=model)
+
+
+def _usage_tokens(response: httpx.Response, model: str = "") -> Optional[int]:
+    try:
+        usage = response.json()["usage"]
+    except Exception:
+        return None
+    record_usage(model, usage)
+    return int(usage.get("total_tokens", 0)) or None
+
+
+async def post_chat(
+    payload: Dict[str, Any],
+    timeout: Optional[float] = None,
+    coalesce: bool = True,
+    priority: int = PRIORITY_BULK,
+) -> httpx.Response:
+    """
+    POST a chat completion payload to Groq and return the raw response.
+    With `coalesce`, concurrent identical payloads share one request.
+    `priority` orders queued calls (scheduler.PRIORITY_INTERACTIVE first).
+    """
+    async def send() -> httpx.Response:
+        return await get_client().post(GROQ_ENDPOINT, headers=_headers(), json=payload,
+                                       timeout=_http_timeout(timeout))
+
+    async def call() -> httpx.Response:
+        response, estimate = await _scheduled(send, payload, priority)
+        used = _usage_tokens(response, payload.get("model", "")) if response.status_code == 200 else 0
+        if used is not None:
+            scheduler.reconcile(payload.get("model", ""), estimate, used)
+        return response
+
+    if not coalesce:
+        return await call()
+    return await _singleflight.do(make_key(payload), call)
+
+
+def singleflight_stats() -> Dict[str, Any]:
+    return _singleflight.stats()
+
+
+def scheduler_stats() -> Dict[str, Any]:
+    return scheduler.stats()
+
+
+async def stream_chat(
+    payload: Dict[str, Any],
+    timeout: Optional[float] = None,
+    priority: int = PRIORITY_BULK,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    POST a chat completion with `stream: true` and yield each decoded chunk.
+
+    Groq streams OpenAI-style SSE lines (`data: {...}`) terminated by
+    `data: [DONE]`. Non-200 responses raise httpx.HTTPStatusError.
+    """
+    body = dict(payload, stream=True)
+    async def send() -> httpx.Response:
+        request = get_client().build_request("POST", GROQ_ENDPOINT, headers=_headers(), json=body,
+                                             timeout=_http_timeout(timeout))
+        return await get_client().send(request, stream=True)
+
+    response, estimate = await _scheduled(send, body, priority)
+    used = 0
+    usage: Optional[Dict[str, Any]] = None
+    try:
+        if response.status_code != 200:
+            await response.aread()
+            response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            left = admission.remaining()
+            if left is not None and left <= 0:
+                raise admission.DeadlineExceeded("Request deadline exceeded")
+            usage = chunk_usage(chunk) or usage
+            if usage:
+                used = usage.get("total_tokens", used)
+            yield chunk
+    finally:
+        await response.aclose()
+        record_usage(body.get("model", ""), usage)
+        scheduler.reconcile(body.get("model", ""), estimate, used or estimate)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local token estimate (no tokenizer): ~4 chars per token for prose,
+    but never fewer than ~1.3 tokens per word/symbol run.
+    """
+    if not text:
+        return 0
+    words = len(text.split())
+    return max(len(text) // 4, int(words * 1.3)) + 1
+
+
+def chunk_usage(chunk: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Usage block of a streamed chunk (Groq puts it under `x_groq` on the last one)."""
+    return chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
@@ -0,0 +1,253 @@
+"""
+JSON helpers for LLM output.
+
+- extract_json: single-pass extractor with repair. Skips leading chatter and
+  code fences, drops trailing commas, escapes raw newlines in strings, and
+  when the output was cut off at max_tokens closes the open string and
+  containers (backing off to the last complete element if needed). Reports
+  every repair it made.
+- ArrayObjectStreamer: incremental parser for a streamed JSON document that
+  emits each object of a top-level array (e.g. "evaluations") as soon as its
+  closing brace arrives, without waiting for the rest of the document.
+"""
+
+from __future__ import annotations
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+_CLOSER = {"{": "}", "[": "]"}
+_decoder = json.JSONDecoder()
+
+
+@dataclass
+class ExtractResult:
+    value: Any
+    text: str
+    repairs: List[str] = field(default_factory=list)
+
+
+_STRING_RUN = re.compile(r'[^"\\\n\r\t]+')
+_PLAIN_RUN = re.compile(r'[^"{}\[\],]+')
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+def _strip_trailing_comma(out: List[str]) -> bool:
+    """Drop a trailing comma (and any whitespace after it) from the output pieces."""
+    j = len(out) - 1
+    while j >= 0 and not out[j].strip():
+        j -= 1
+    if j >= 0 and out[j].rstrip().endswith(","):
+        out[j] = out[j].rstrip()[:-1]
+        del out[j + 1:]
+        return True
+    return False
+
+
+def _close(out: List[str], stack: List[str]) -> str:
+    tail = list(out)
+    _strip_trailing_comma(tail)
+    return "".join(tail).rstrip() + "".join(_CLOSER[c] for c in reversed(stack))
+
+
+def extract_json(text: str, opening: str = "{") -> ExtractResult:
+    """
+    Pull the first JSON value starting with one of `opening` out of LLM text,
+    repairing common defects. Raises ValueError if nothing parseable is found.
+    """
+    start = -1
+    for ch in opening:
+        idx = text.find(ch)
+        if idx != -1 and (start == -1 or idx < start):
+            start = idx
+    if start == -1:
+        raise ValueError("No valid JSON object found.")
+
+    repairs: List[str] = []
+    if text[start:].lstrip() != text.lstrip():
+        repairs.append("skipped leading text")
+
+    # Fast path: well-formed JSON (possibly with chatter around it) parses in C.
+    try:
+        value, end = _decoder.raw_decode(text, start)
+        if text[end:].strip().strip("`").strip():
+            repairs.append("ignored trailing text")
+        return ExtractResult(value, text[start:end], repairs)
+    except json.JSONDecodeError:
+        pass
+
+    out: List[str] = []
+    stack: List[str] = []
+    # (output length, stack) right before each separator comma: safe cut points
+    cut_points: List[Tuple[int, List[str]]] = []
+    in_string = escape = False
+    end = len(text)
+    i = start
+    n = len(text)
+    while i < n:
+        if in_string:
+            if escape:
+                out.append(text[i])
+                escape = False
+                i += 1
+                continue
+            m = _STRING_RUN.match(text, i)
+            if m:
+                out.append(m.group(0))
+                i = m.end()
+                continue
+            ch = text[i]
+            if ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            else:
+                ch = _CONTROL_ESCAPES[ch]
+                if "escaped control character" not in repairs:
+                    repairs.append("escaped control character")
+            out.append(ch)
+            i += 1
+            continue
+
+        m = _PLAIN_RUN.match(text, i)
+        if m:
+            out.append(m.group(0))
+            i = m.end()
+            continue
+
+        ch = text[i]
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if _strip_trailing_comma(out) and "removed trailing comma" not in repairs:
+                repairs.append("removed trailing comma")
+            if not stack:
+                i += 1
+                continue
+            if _CLOSER[stack[-1]] != ch:
+                # Mismatched closer: close the inner container(s) first.
+                while stack and _CLOSER[stack[-1]] != ch:
+                    out.append(_CLOSER[stack.pop()])
+                repairs.append("fixed mismatched bracket")
+                if not stack:
+                    end = i
+                    break
+            stack.pop()
+            out.append(ch)
+            if not stack:
+                end = i + 1
+                break
+            i += 1
+            continue
+        elif ch == ",":
+            cut_points.append((len(out), list(stack)))
+        out.append(ch)
+        i += 1
+
+    if end < len(text) and text[end:].strip().strip("`").strip():
+        repairs.append("ignored trailing text")
+
+    if not stack and not in_string:
+        candidate = "".join(out)
+        try:
+            return ExtractResult(json.loads(candidate), candidate, repairs)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON after repair: {e}") from e
+
+    # Truncated output: close what is open, backing off to earlier cut points.
+    repairs.append("closed truncated output")
+    if in_string:
+        out.append('"')
+    attempts = [(len(out), stack)] + list(reversed(cut_points))
+    for length, open_stack in attempts[:50]:
+        candidate = _close(out[:length], open_stack)
+        try:
+            return ExtractResult(json.loads(candidate), candidate, repairs)
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("Could not repair truncated JSON.")
+
+
+def loads_lenient(text: str) -> Any:
+    """json.loads with extract_json's repairs as a fallback."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return extract_json(text, "{[").value
+
+
+class ArrayObjectStreamer:
+    """
+    Feed text chunks with `feed()`; get back the objects of the array stored
+    under `key` in the top-level object that completed in those chunks.
+    Text before the first `{` (chatter, code fences) is skipped.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.buffer = ""
+        self.pos = 0
+        self.stack: List[str] = []     # open containers: "{" or "["
+        self.in_string = False
+        self.escape = False
+        self.string_start = -1
+        self.last_string: Optional[str] = None
+        self.top_key: Optional[str] = None  # most recent key of the top-level object
+        self.array_depth = -1               # stack depth of the target array, once open
+        self.object_start = -1
+        self.errors = 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        self.buffer += text
+        out: List[Dict[str, Any]] = []
+        buf = self.buffer
+        i = self.pos
+        while i < len(buf):
+            ch = buf[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if len(self.stack) == 1 and self.stack[0] == "{":
+                        self.last_string = buf[self.string_start + 1:i]
+                i += 1
+                continue
+
+            if ch == '"':
+                if self.stack:
+                    self.in_string = True
+                    self.string_start = i
+            elif ch == ":" and len(self.stack) == 1:
+                self.top_key = self.last_string
+            elif ch in "{[":
+                if ch == "[" and len(self.stack) == 1 and self.top_key == self.key and self.array_depth < 0:
+                    self.array_depth = 2
+                self.stack.append(ch)
+                if ch == "{" and self.array_depth > 0 and len(self.stack) == self.array_depth + 1:
+                    self.object_start = i
+            elif ch in "}]" and self.stack:
+                self.stack.pop()
+                if ch == "}" and self.object_start >= 0 and len(self.stack) == self.array_depth:
+                    obj = self._parse(buf[self.object_start:i + 1])
+                    if obj is not None:
+                        out.append(obj)
+                    self.object_start = -1
+                elif ch == "]" and len(self.stack) == self.array_depth - 1:
+                    self.array_depth = -1
+            i += 1
+        self.pos = i
+        return out
+
+    def _parse(self, text: str) -> Optional[Dict[str, Any]]:
+        try:
+            obj = loads_lenient(text)
+        except ValueError:
+            self.errors += 1
+            return None
+        return obj if isinstance(obj, dict) else None
@@ -0,0 +1,374 @@
+"""
+Deterministic local grading for questions that don't need an LLM.
+
+Applies the same marking rules as the grader prompt:
+- MCQ / objective: exact option match (proportional for multi-option keys).
+- Numerical: every distinct value in the key must match the student's
+  value for it within tolerance (≤0.005 if |value| ≤ 10, else ≤0.01) with
+  an equal or equivalent unit; marks are proportional to values matched.
+  The student's value for a key value is the last one with the same label
+  ("f = 8 cm" for "f = 24 cm"), else the only one of the same dimension.
+  Several competing candidates, or unit text left over after parsing
+  ("2 m per second"), leave the question to the LLM.
+- Diagram: always full marks (images can't be attached).
+
+`grade_locally(item)` returns an evaluation in the grader's output schema,
+or None when the rules can't decide (descriptive answers, unparseable keys)
+and the item has to go to the LLM.
+"""
+
+from __future__ import annotations
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# ------------------------------
+# Question types
+# ------------------------------
+def question_kind(qtype: str) -> str:
+    t = (qtype or "").strip().lower()
+    if "diagram" in t or "draw" in t:
+        return "diagram"
+    if "mcq" in t or "objective" in t or "multiple" in t or "choice" in t:
+        return "mcq"
+    if "numer" in t or "calculat" in t:
+        return "numerical"
+    return "descriptive"
+
+
+# ------------------------------
+# Units
+# ------------------------------
+# alias -> (dimension, factor to SI base). Aliases are matched lowercased
+# with spaces removed, except where case matters (handled in _UNIT_CASED).
+_UNITS: Dict[str, Tuple[str, float]] = {
+    # length
+    "m": ("length", 1.0), "metre": ("length", 1.0), "meter": ("length", 1.0),
+    "metres": ("length", 1.0), "meters": ("length", 1.0),
+    "cm": ("length", 1e-2), "centimetre": ("length", 1e-2), "centimeter": ("length", 1e-2),
+    "mm": ("length", 1e-3), "km": ("length", 1e3), "nm": ("length", 1e-9),
+    "å": ("length", 1e-10), "angstrom": ("length", 1e-10),
+    # mass
+    "kg": ("mass", 1.0), "g": ("mass", 1e-3), "gram": ("mass", 1e-3), "grams": ("mass", 1e-3),
+    "mg": ("mass", 1e-6),
+    # time
+    "s": ("time", 1.0), "sec": ("time", 1.0), "second": ("time", 1.0), "seconds": ("time", 1.0),
+    "ms": ("time", 1e-3), "min": ("time", 60.0), "minute": ("time", 60.0), "minutes": ("time", 60.0),
+    "h": ("time", 3600.0), "hr": ("time", 3600.0), "hour": ("time", 3600.0), "hours": ("time", 3600.0),
+    # speed / acceleration
+    "m/s": ("speed", 1.0), "ms-1": ("speed", 1.0), "ms^-1": ("speed", 1.0), "ms⁻¹": ("speed", 1.0),
+    "km/h": ("speed", 1 / 3.6), "kmh-1": ("speed", 1 / 3.6), "cm/s": ("speed", 1e-2),
+    "m/s2": ("accel", 1.0), "m/s^2": ("accel", 1.0), "m/s²": ("accel", 1.0), "ms-2": ("accel", 1.0),
+    "ms^-2": ("accel", 1.0), "ms⁻²": ("accel", 1.0),
+    # force / energy / power
+    "n": ("force", 1.0), "newton": ("force", 1.0), "newtons": ("force", 1.0), "kn": ("force", 1e3),
+    "dyne": ("force", 1e-5),
+    "j": ("energy", 1.0), "joule": ("energy", 1.0), "joules": ("energy", 1.0), "kj": ("energy", 1e3),
+    "erg": ("energy", 1e-7), "ev": ("energy", 1.602176634e-19), "mev": ("energy", 1.602176634e-13),
+    "kwh": ("energy", 3.6e6), "cal": ("energy", 4.184), "kcal": ("energy", 4184.0),
+    "w": ("power", 1.0), "watt": ("power", 1.0), "watts": ("power", 1.0), "kw": ("power", 1e3),
+    "hp": ("power", 746.0),
+    # electricity
+    "a": ("current", 1.0), "amp": ("current", 1.0), "ampere": ("current", 1.0), "amperes": ("current", 1.0),
+    "ma": ("current", 1e-3),
+    "v": ("voltage", 1.0), "volt": ("voltage", 1.0), "volts": ("voltage", 1.0), "kv": ("voltage", 1e3),
+    "ω": ("resistance", 1.0), "ohm": ("resistance", 1.0), "ohms": ("resistance", 1.0),
+    "kω": ("resistance", 1e3), "kohm": ("resistance", 1e3),
+    "c": ("charge", 1.0), "coulomb": ("charge", 1.0),
+    # optics / waves / misc
+    "d": ("power_lens", 1.0), "dioptre": ("power_lens", 1.0), "diopter": ("power_lens", 1.0),
+    "dioptres": ("power_lens", 1.0),
+    "hz": ("frequency", 1.0), "khz": ("frequency", 1e3), "mhz": ("frequency", 1e6),
+    "pa": ("pressure", 1.0), "kpa": ("pressure", 1e3),
+    "°c": ("temp_c", 1.0), "degc": ("temp_c", 1.0), "k": ("temp_k", 1.0), "kelvin": ("temp_k", 1.0),
+    "j/kg°c": ("spec_heat", 1.0), "jkg-1°c-1": ("spec_heat", 1.0), "jkg-1k-1": ("spec_heat", 1.0),
+    "j/kgk": ("spec_heat", 1.0), "j/kg": ("latent_heat", 1.0), "jkg-1": ("latent_heat", 1.0),
+    "j/g": ("latent_heat", 1e3), "j/°c": ("heat_cap", 1.0), "j/k": ("heat_cap", 1.0),
+    "%": ("percent", 1.0), "°": ("angle", 1.0), "degree": ("angle", 1.0), "degrees": ("angle", 1.0),
+}
+
+# Case-sensitive spellings whose lowercase form would collide.
+_UNIT_CASED: Dict[str, Tuple[str, float]] = {
+    "MJ": ("energy", 1e6), "mJ": ("energy", 1e-3), "MW": ("power", 1e6), "mW": ("power", 1e-3),
+    "MΩ": ("resistance", 1e6), "mV": ("voltage", 1e-3), "MV": ("voltage", 1e6),
+    "μm": ("length", 1e-6), "µm": ("length", 1e-6), "μA": ("current", 1e-6), "µA": ("current", 1e-6),
+    "μs": ("time", 1e-6), "µs": ("time", 1e-6),
+}
+
+# Numerical keys longer than this are treated as worked solutions (LLM-graded).
+MAX_KEY_VALUES = 4
+MAX_KEY_CHARS = 120
+
+_NUMBER = r"[-+−]?(?:\d+(?:,\d{3})*(?:\.\d+)?|\.\d+)(?:\s*(?:[x×]\s*10\s*\^?\s*[-+−]?\d+|[eE][-+−]?\d+))?"
+_QUANTITY_RE = re.compile(
+    r"(?<![\w.])(" + _NUMBER + r")\s*([A-Za-zμµΩω°%Å/\^\-⁻¹²³\d·.]*)"
+)
+_SUPERSCRIPTS = str.maketrans("⁻¹²³⁰⁴⁵⁶⁷⁸⁹", "-1230456789")
+
+
+def _parse_number(text: str) -> float:
+    t = text.replace("−", "-").replace(",", "").replace(" ", "")
+    m = re.match(r"^([-+]?[\d.]+)[x×]10\^?([-+]?\d+)$", t)
+    if m:
+        return float(m.group(1)) * 10 ** int(m.group(2))
+    return float(t)
+
+
+def _lookup_unit(raw: str) -> Tuple[Optional[Tuple[str, float]], bool]:
+    """Return (unit, recognised). An empty unit is (None, True)."""
+    raw = raw.strip().rstrip(".·")
+    if not raw:
+        return None, True
+    if raw in _UNIT_CASED:
+        return _UNIT_CASED[raw], True
+    key = raw.replace("·", "").lower()
+    if key in _UNITS:
+        return _UNITS[key], True
+    key = key.translate(_SUPERSCRIPTS)
+    if key in _UNITS:
+        return _UNITS[key], True
+    return None, False
+
+
+def extract_quantities(text: str) -> List[Tuple[float, Optional[Tuple[str, float]], bool, str]]:
+    """All (value, unit, unit_recognised, raw_text) tuples found in free text."""
+    out = []
+    for m in _QUANTITY_RE.finditer(text or ""):
+        try:
+            value = _parse_number(m.group(1))
+        except ValueError:
+            continue
+        unit, known = _lookup_unit(m.group(2))
+        out.append((value, unit, known, m.group(0).strip()))
+    return out
+
+
+_LABEL_RE = re.compile(r"([A-Za-z][A-Za-z0-9_]*)\s*[=:]\s*$")
+# Unit text continuing past what was parsed as the unit: "2 m per second", "2 m s-1"
+_UNIT_TAIL_RE = re.compile(r"\s*(per\b|/|[A-Za-zμµΩω°Å][A-Za-zμµΩω°Å\-\^⁻¹²³\d]*)")
+
+
+def _unit_continues(text: str, end: int) -> bool:
+    m = _UNIT_TAIL_RE.match(text, end)
+    if not m:
+        return False
+    word = m.group(1)
+    return word in ("per", "/") or _lookup_unit(word)[0] is not None
+
+
+def labelled_quantities(text: str) -> List[Dict[str, Any]]:
+    """Quantities with the label written before them ("f = 24 cm" -> "f") and leftover-unit flag."""
+    text = text or ""
+    out = []
+    for m in _QUANTITY_RE.finditer(text):
+        try:
+            value = _parse_number(m.group(1))
+        except ValueError:
+            continue
+        unit, known = _lookup_unit(m.group(2))
+        label = _LABEL_RE.search(text[max(0, m.start() - 24):m.start()])
+        out.append({
+            "quantity": (value, unit, known, m.group(0).strip()),
+            "label": label.group(1) if label else None,
+            "unit_tail": bool(m.group(2).strip()) and _unit_continues(text, m.end()),
+        })
+    return out
+
+
+def _same_dimension(expected, given) -> bool:
+    """Could `given` be the student's value for `expected`? (unrecognised units: maybe)"""
+    if not given[2]:
+        return True
+    if expected[1] is None or given[1] is None:
+        return expected[1] is None and given[1] is None
+    return expected[1][0] == given[1][0]
+
+
+def _student_value(expected: Dict[str, Any], given: List[Dict[str, Any]]):
+    """
+    The student's quantity for a key value: their last one under the same
+    label, else the only one of the same dimension. (None, True) when there
+    is none; (None, False) when several compete and the rules can't tell.
+    """
+    if expected["label"]:
+        same_label = [g for g in given if g["label"] == expected["label"]]
+        if same_label:
+            return same_label[-1]["quantity"], True
+    candidates = [g for g in given if _same_dimension(expected["quantity"], g["quantity"])]
+    if len(candidates) > 1:
+        return None, False
+    return (candidates[0]["quantity"] if candidates else None), True
+
+
+def _tolerance(value: float) -> float:
+    return 0.005 if abs(value) <= 10 else 0.01
+
+
+def _value_matches(expected, given) -> Optional[bool]:
+    """True/False if decidable, None if the student's unit is unrecognised."""
+    e_val, e_unit = expected[0], expected[1]
+    g_val, g_unit, g_known = given[0], given[1], given[2]
+    if not g_known:
+        return None
+    if e_unit is None:
+        return g_unit is None and abs(g_val - e_val) <= _tolerance(e_val)
+    if g_unit is None or g_unit[0] != e_unit[0]:
+        return False
+    converted = g_val * g_unit[1] / e_unit[1]
+    return abs(converted - e_val) <= _tolerance(e_val)
+
+
+# ------------------------------
+# Graders
+# ------------------------------
+def _fmt_marks(x: float):
+    x = round(x, 2)
+    return int(x) if x == int(x) else x
+
+
+def _evaluation(item: Dict[str, Any], kind: str, awarded: float, mistake: str,
+                mistake_type: str, feedback: str, key_parts: List[str]) -> Dict[str, Any]:
+    marks = item.get("marks", 0)
+    if awarded >= marks:
+        verdict = "correct"
+    elif awarded <= 0:
+        verdict = "incorrect"
+    else:
+        verdict = "partially correct"
+    return {
+        "question_number": item.get("question_number", ""),
+        "type": item.get("type", kind),
+        "verdict": verdict,
+        "marks_awarded": _fmt_marks(awarded),
+        "total_marks": marks,
+        "mistake": mistake,
+        "correct_answer": key_parts,
+        "mistake_type": mistake_type,
+        "feedback": feedback,
+    }
+
+
+_LEADING_OPTION_RE = re.compile(r"^\s*(?:option\s*)?(?:\(([a-d])\)|([a-d])[.):])", re.I)
+
+
+def _options(text: str) -> Optional[List[str]]:
+    """Option letters in an MCQ answer, e.g. "(b) 25 cm" -> ["b"], "a and c" -> ["a", "c"]."""
+    t = (text or "").strip()
+    if not t:
+        return None
+    tokens = re.split(r"[\s,;/&]+|\band\b", re.sub(r"\boptions?\b", " ", t, flags=re.I), flags=re.I)
+    tokens = [x.strip("().:") for x in tokens if x and x.strip("().:")]
+    if tokens and all(re.fullmatch(r"[a-d]", x, re.I) for x in tokens):
+        return sorted({x.lower() for x in tokens})
+    m = _LEADING_OPTION_RE.match(t)
+    if m:
+        return [(m.group(1) or m.group(2)).lower()]
+    return None
+
+
+def _grade_mcq(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    key_text = item.get("correct_answer", "")
+    answer_text = item.get("user_answer", "")
+    marks = item.get("marks", 0)
+    expected = _options(key_text)
+    given = _options(answer_text)
+
+    if expected is None or given is None:
+        # Fall back to exact text match; anything fuzzier needs the LLM.
+        if _normalize_text(key_text) and _normalize_text(key_text) == _normalize_text(answer_text):
+            return _evaluation(item, "mcq", marks, "", "none", "Correct option chosen.", [key_text])
+        return None
+
+    right = [o for o in given if o in expected]
+    wrong = [o for o in given if o not in expected]
+    if len(expected) == 1:
+        awarded = marks if given == expected else 0
+    else:
+        awarded = max(0, len(right) - len(wrong)) / len(expected) * marks
+
+    if awarded >= marks:
+        return _evaluation(item, "mcq", marks, "", "none", "Correct option chosen.", [key_text])
+    chosen = ", ".join(f"({o})" for o in given)
+    correct = ", ".join(f"({o})" for o in expected)
+    return _evaluation(
+        item, "mcq", awarded,
+        f"Chose {chosen}; the correct option(s): {correct}.",
+        "conceptual",
+        f"The correct answer is {key_text.strip()}. Revise this concept and check why {chosen} does not fit.",
+        [key_text],
+    )
+
+
+def _grade_numerical(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    key_text = item.get("correct_answer", "")
+    expected = labelled_quantities(key_text)
+    given = labelled_quantities(item.get("user_answer", ""))
+    if not expected or not given or any(g["unit_tail"] for g in given):
+        return None
+
+    # Distinct required values; the same value quoted twice counts once.
+    required = []
+    for e in expected:
+        q = e["quantity"]
+        if not any(q[0] == r["quantity"][0] and q[1] == r["quantity"][1] for r in required):
+            required.append(e)
+    # Long keys usually carry working steps whose intermediate numbers are
+    # not all "required values"; leave those to the LLM.
+    if len(required) > MAX_KEY_VALUES or len(key_text) > MAX_KEY_CHARS:
+        return None
+
+    matched = 0
+    missing = []
+    for e in required:
+        value, decidable = _student_value(e, given)
+        if not decidable:
+            return None
+        result = _value_matches(e["quantity"], value) if value is not None else False
+        if result is None:
+            return None
+        if result:
+            matched += 1
+        else:
+            missing.append(e["quantity"])
+
+    marks = item.get("marks", 0)
+    awarded = matched / len(required) * marks
+    key_parts = [p.strip() for p in re.split(r"[;\n]|,\s(?=\D)", key_text) if p.strip()] or [key_text]
+    if not missing:
+        return _evaluation(item, "numerical", awarded, "", "none",
+                           "All required values and units are correct.", key_parts)
+
+    missing_text = ", ".join(q[3] for q in missing)
+    return _evaluation(
+        item, "numerical", awarded,
+        f"{len(missing)} of {len(required)} required values wrong or missing (expected {missing_text}).",
+        "numerical",
+        f"Official answer: {key_text.strip()}. Recheck the formula, substitution and units for the value(s) {missing_text}.",
+        key_parts,
+    )
+
+
+def _normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").strip().lower()).rstrip(".")
+
+
+def grade_locally(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Grade one question in-process, or return None if the LLM must decide."""
+    kind = question_kind(item.get("type", ""))
+    marks = item.get("marks", 0)
+    key_text = item.get("correct_answer", "")
+
+    if kind == "diagram":
+        return _evaluation(item, kind, marks, "", "none",
+                           "Diagram answers are awarded full marks.", [key_text])
+
+    if not (item.get("user_answer") or "").strip():
+        return _evaluation(item, kind, 0, "No answer given.", "unattempted",
+                           f"This question was not attempted. Official answer: {key_text.strip()}",
+                           [key_text])
+
+    if kind == "mcq":
+        return _grade_mcq(item)
+    if kind == "numerical":
+        return _grade_numerical(item)
+    return None
@@ -1,19 +1,37 @@
-from fastapi import FastAPI
+import config  # first: loads .env once and starts the time-to-ready clock
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import Any, Dict, List, Optional
+import asyncio
 import json
 
 # Import necessary functions
-from planner import create_planner_prompt, ask_groq_api
-from grader import evaluate_answer_batch
+from planner import generate_plan, replan
+from grader import evaluate_answer_batch, stream_answer_batch
+import grader
 from questions import get_questions
-from doubtsolver import solve_doubt
+import questions
+import retrieval
+import rubric
+import pdf_store
+from doubtsolver import solve_doubt, stream_doubt
+import doubtsolver
+import admission
+import conversation
+import jobs
+import llm_client
+import metrics
+import planner
+import router
 
 app = FastAPI()
 print("App starts")
 
+# Per-route concurrency limits and deadlines; inside CORS so 503s stay readable by the browser
+app.add_middleware(admission.AdmissionMiddleware)
+
 # Enable CORS
 origins = [
     "https://studia-ai.vercel.app",
@@ -26,6 +44,60 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Values owned by other modules, read at scrape time
+_CACHES = {
+    "doubt_answers": doubtsolver.cache_stats,
+    "context_summaries": conversation.cache_stats,
+    "grading": grader.cache_stats,
+    "paper_fields": questions.cache_stats,
+    "rubrics": rubric.cache_stats,
+}
+
+def _cache_counts(field: str) -> Dict[tuple, float]:
+    return {(name, ): stats()[field] for name, stats in _CACHES.items()}
+
+metrics.Callback("cache_hits_total", "Cache hits", "counter", ("cache",), lambda: _cache_counts("hits"))
+metrics.Callback("cache_misses_total", "Cache misses", "counter", ("cache",), lambda: _cache_counts("misses"))
+metrics.Callback("cache_entries", "Cached entries", "gauge", ("cache",), lambda: _cache_counts("size"))
+metrics.Callback("llm_queue_depth", "LLM calls waiting in the scheduler", "gauge", ("model",),
+                 lambda: {(model, ): s["queued"] for model, s in llm_client.scheduler_stats().items()})
+metrics.Callback("http_requests_in_flight", "Admitted requests being served", "gauge", ("route",),
+                 lambda: {(r, ): s["active"] for r, s in admission.stats().items()})
+metrics.Callback("http_requests_queued", "Requests waiting for an admission slot", "gauge", ("route",),
+                 lambda: {(r, ): s["waiting"] for r, s in admission.stats().items()})
+metrics.Callback("app_time_to_ready_seconds", "Import of config to end of startup warm-up", "gauge", (),
+                 lambda: {(): config.time_to_ready()} if config.time_to_ready() is not None else {})
+metrics.Callback("llm_singleflight_deduplicated_total", "LLM calls served by an in-flight twin", "counter", (),
+                 lambda: {(): llm_client.singleflight_stats()["deduplicated"]})
+
+async def preload_papers():
+    if questions.QNA_PRELOAD:
+        result = await asyncio.to_thread(questions.preload)
+        for paper in result["loaded"]:
+            await asyncio.to_thread(rubric.paper_rubrics, paper)
+        await asyncio.to_thread(retrieval.index_papers, result["loaded"])
+        print(f"Preloaded {len(result['loaded'])} papers (fields, rubrics and QnA index)", flush=True)
+
+async def prewarm_llm_connections():
+    opened = await llm_client.warm_up()
+    print(f"Pre-opened {opened} LLM connections", flush=True)
+
+@app.on_event("startup")
+async def warm_up():
+    # Hot papers and LLM connections load side by side, before traffic arrives.
+    await asyncio.gather(preload_papers(), prewarm_llm_connections())
+    jobs.start_workers()
+    print(f"Ready in {config.mark_ready()}s", flush=True)
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm_client.close_client()
+
+@app.on_event("shutdown")
+async def stop_grading_workers():
+    await jobs.stop_workers()
 
 # ============================
 # Pydantic Models
@@ -35,6 +107,8 @@ class DoubtRequest(BaseModel):
     prompt: str
     important: bool = False
     context: List[str] = []
+    bypass_cache: bool = False
+    conversation_id: str = ""
 
 class PlannerRequest(BaseModel):
     subjects: List[str]
@@ -48,6 +122,11 @@ class PlannerRequest(BaseModel):
     days_per_week: List[str]
     start_date: List[int]
 
+class ReplanRequest(PlannerRequest):
+    plan: Dict[str, Any]
+    from_date: List[int]
+    completed_chapters: List[str] = []
+
 class QuestionsRequest(BaseModel):
     filename: str
 
@@ -60,6 +139,22 @@ class QuestionItem(BaseModel):
 
 class GradeRequest(BaseModel):
     questions: List[QuestionItem]
+    shard: bool = False
+    paper: str = ""  # fields.json paper name: grade against its precompiled rubrics
+    marks_only: bool = False  # verdicts and marks only; feedback via /grade_feedback
+
+class FeedbackRequest(QuestionItem):
+    marks_awarded: Optional[float] = None  # from a marks-only grading, kept as is
+    paper: str = ""
+
+class AnswerSheet(BaseModel):
+    student_id: str = ""
+    questions: List[QuestionItem]
+
+class GradeJobRequest(BaseModel):
+    sheets: List[AnswerSheet]
+    shard: bool = False
+    paper: str = ""
 
 # ============================
 # Routes
@@ -70,50 +165,135 @@ def fetch_questions(req: QuestionsRequest):
     result = get_questions(req.filename)
     if "error" in result:
         return JSONResponse(content=result)
+    retrieval.index_paper(req.filename)  # identity check once indexed: no hashing on this path
     return JSONResponse(content={
         "fields": result.get("fields", []),
         "pdf_url": result.get("pdf_url", "")
     })
 
 @app.get("/download_pdf")
-def download_pdf(path: str):
-    return FileResponse(path, media_type="application/pdf", filename="qpaper.pdf")
+def download_pdf(request: Request, path: str = "", paper: str = ""):
+    try:
+        if paper:
+            digest = pdf_store.store_paper(paper)
+            return pdf_store.pdf_response(request, pdf_store.path_for_digest(digest), digest)
+        return pdf_store.pdf_response(request, path)
+    except (OSError, ValueError) as e:
+        return JSONResponse(status_code=404, content={"error": f"PDF not found: {str(e)}"})
+
+@app.get("/pdf/{digest}")
+def download_pdf_by_digest(request: Request, digest: str):
+    try:
+        return pdf_store.pdf_response(request, pdf_store.path_for_digest(digest), digest)
+    except (OSError, ValueError) as e:
+        return JSONResponse(status_code=404, content={"error": f"PDF not found: {str(e)}"})
 
 @app.post("/grade_batch")
-def grade_batch(req: GradeRequest):
+async def grade_batch(req: GradeRequest):
     batch_data = [item.dict() for item in req.questions]
-    result_str = evaluate_answer_batch(batch_data)
+    result_str = await evaluate_answer_batch(batch_data, shard=req.shard, paper=req.paper, marks_only=req.marks_only)
     try:
         result_json = json.loads(result_str)
         return JSONResponse(content=result_json)
     except json.JSONDecodeError as e:
+        # Error strings (HTTP errors, timeouts) land here too; real parse failures are counted in grader
         return JSONResponse(content={
             "error": "Invalid JSON returned by LLM",
             "details": str(e),
             "raw_response": result_str
         })
 
+@app.post("/grade_batch_stream")
+async def grade_batch_stream(req: GradeRequest):
+    batch_data = [item.dict() for item in req.questions]
+    return StreamingResponse(
+        stream_answer_batch(batch_data, shard=req.shard, paper=req.paper, marks_only=req.marks_only),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/grade_feedback")
+async def grade_feedback(req: FeedbackRequest):
+    item = req.dict(exclude={"marks_awarded", "paper"})
+    return JSONResponse(content=await grader.question_feedback(item, req.marks_awarded, req.paper))
+
+@app.post("/grade_jobs")
+async def submit_grade_job(req: GradeJobRequest):
+    sheets = [{"student_id": s.student_id, "questions": [q.dict() for q in s.questions]} for s in req.sheets]
+    return JSONResponse(status_code=202, content=await jobs.submit(sheets, shard=req.shard, paper=req.paper))
+
+@app.get("/grade_jobs/{job_id}")
+async def grade_job_status(job_id: str):
+    status = await jobs.progress(job_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return JSONResponse(content=status)
+
+@app.get("/grade_jobs/{job_id}/results")
+async def grade_job_results(job_id: str):
+    result = await jobs.results(job_id)
+    if result is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return JSONResponse(content=result)
+
+@app.get("/grade_jobs/{job_id}/stream")
+async def grade_job_stream(job_id: str):
+    return StreamingResponse(
+        jobs.stream_progress(job_id),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post("/solve_doubt")
-def solve_doubt_endpoint(req: DoubtRequest):
-    answer = solve_doubt(req.prompt, req.important, req.context)
+async def solve_doubt_endpoint(req: DoubtRequest):
+    answer = await solve_doubt(req.prompt, req.important, req.context, req.bypass_cache, req.conversation_id)
     return JSONResponse(content={"response": answer})
 
+@app.post("/solve_doubt_stream")
+async def solve_doubt_stream_endpoint(req: DoubtRequest):
+    return StreamingResponse(
+        stream_doubt(req.prompt, req.important, req.context, req.bypass_cache, req.conversation_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post("/generate_planner")
-def generate_planner(req: PlannerRequest):
-    prompt = create_planner_prompt(req)
-    raw_response = ask_groq_api(prompt, "llama3-8b-8192")
-    try:
-        parsed = json.loads(raw_response)
-        return JSONResponse(content=parsed)
-    except json.JSONDecodeError as e:
+async def generate_planner(req: PlannerRequest):
+    plan = await generate_plan(req, planner.PLANNER_MODEL)
+    if plan["study_plan"] and len(plan.get("incomplete_weeks", [])) == len(plan["study_plan"]):
         return JSONResponse(content={
             "error": "Invalid JSON returned by LLM",
-            "details": str(e),
-            "raw_response": raw_response
+            "details": "No week of the plan could be generated",
         })
+    return JSONResponse(content=plan)
+
+@app.post("/replan")
+async def replan_endpoint(req: ReplanRequest):
+    plan = await replan(req, req.plan, req.from_date, req.completed_chapters, planner.PLANNER_MODEL)
+    return JSONResponse(content=plan)
+
+@app.get("/cache_stats")
+def cache_stats():
+    return JSONResponse(content={
+        "doubt_answers": doubtsolver.cache_stats(),
+        "context_summaries": conversation.cache_stats(),
+        "grading": grader.cache_stats(),
+        "paper_fields": questions.cache_stats(),
+        "rubrics": rubric.cache_stats(),
+        "llm_singleflight": llm_client.singleflight_stats(),
+        "llm_scheduler": llm_client.scheduler_stats(),
+        "llm_router": router.stats(),
+        "admission": admission.stats(),
+        "qna_index": retrieval.stats(),
+    })
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/health")
-def health_check():
-    return JSONResponse(content={"status": "ok"})
+async def health_check():
+    # async: answered on the event loop even when the threadpool is saturated
+    return JSONResponse(content={"status": "ok", **config.startup_stats()})
 
 
@@ -0,0 +1,181 @@
+"""
+Minimal Prometheus instrumentation (text exposition format, no extra dependency).
+
+- Counter / Histogram with labels, updated in-process.
+- Callback metrics for values owned elsewhere (cache hit/miss counters,
+  scheduler queue depth), read at scrape time.
+- render() produces the body for GET /metrics.
+- MetricsMiddleware times every request by route template, until the last
+  body chunk is sent (so streamed responses count their full duration).
+
+Metrics are per process: with several uvicorn workers each one is scraped
+(or aggregated) separately.
+"""
+
+from __future__ import annotations
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["_Metric"] = []
+_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with _lock:
+            counts, totals = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, (counts, totals) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _fmt(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(totals[0])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Callback(_Metric):
+    """Metric whose samples come from `fn()` -> {label values tuple: value} at scrape time."""
+
+    def __init__(self, name: str, help_text: str, kind: str, labelnames: Sequence[str],
+                 fn: Callable[[], Dict[LabelValues, float]]):
+        super().__init__(name, help_text, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            samples = self.fn()
+        except Exception:
+            return []
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in sorted(samples.items())
+        ]
+
+
+def render() -> str:
+    with _lock:
+        metrics = list(_registry)
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording http_request_duration_seconds."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = {"code": "500"}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = str(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Templates (/pdf/{digest}) rather than raw paths keep label cardinality bounded.
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - started, method=scope["method"], route=path, status=status["code"])
+
+
+# ------------------------------
+# Service metrics
+# ------------------------------
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+LLM_LATENCY = Histogram(
+    "llm_request_duration_seconds", "Groq call latency (per HTTP attempt)", ("model", "status"))
+LLM_PROMPT_TOKENS = Counter("llm_prompt_tokens_total", "Prompt tokens reported by Groq", ("model",))
+LLM_COMPLETION_TOKENS = Counter("llm_completion_tokens_total", "Completion tokens reported by Groq", ("model",))
+JSON_PARSE_FAILURES = Counter("llm_json_parse_failures_total", "LLM outputs that could not be parsed", ("source",))
+JSON_REPAIRS = Counter("llm_json_repairs_total", "LLM outputs parsed only after repair", ("source", "repair"))
+LLM_HEDGES = Counter("llm_hedges_total", "Hedged requests sent to a fallback model", ("model", "fallback"))
+LLM_HEDGE_WINS = Counter("llm_hedge_wins_total", "Which side answered first after a hedge", ("model", "winner"))
+REQUESTS_SHED = Counter("http_requests_shed_total", "Requests rejected with 503 by admission control", ("route", "reason"))
+DOUBT_RETRIEVAL = Counter("doubt_retrieval_total", "Doubts answered or grounded from the QnA index", ("outcome",))
+HF_DOWNLOAD_LATENCY = Histogram("hf_hub_download_seconds", "hf_hub_download time", ("file",))
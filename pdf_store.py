@@ -0,0 +1,259 @@
+"""
+PDF serving for /download_pdf.
+
+- Content-addressed local store: papers are kept as <sha256>.pdf under
+  PDF_STORE_DIR, so identical files are stored once and a digest doubles
+  as a strong ETag.
+- Conditional requests: If-None-Match / If-Modified-Since answer 304.
+- Single byte ranges (Range / If-Range) answer 206, unsatisfiable ones 416,
+  for PDF viewers that fetch partial content.
+- Zero-copy: when the ASGI server offers the `http.response.zerocopy`
+  extension the body is handed over as a file descriptor (sendfile);
+  otherwise it is streamed in chunks from a worker thread.
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+
+import questions
+
+
+# ------------------------------
+# Config
+# ------------------------------
+PDF_STORE_DIR = os.getenv("PDF_STORE_DIR", os.path.join(tempfile.gettempdir(), "pdf_store"))
+CHUNK_SIZE = 256 * 1024
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+_paper_index: Dict[str, str] = {}
+# Guards _paper_index, index.json and _paper_locks; never held across a download.
+_store_lock = threading.Lock()
+# One lock per paper being fetched, so cold downloads of different papers run in parallel.
+_paper_locks: Dict[str, threading.Lock] = {}
+
+
+# ------------------------------
+# Content-addressed store
+# ------------------------------
+def _index_path() -> str:
+    return os.path.join(PDF_STORE_DIR, "index.json")
+
+
+def _load_index() -> None:
+    if _paper_index or not os.path.isfile(_index_path()):
+        return
+    try:
+        with open(_index_path(), "r", encoding="utf-8") as f:
+            _paper_index.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+
+
+def _save_index() -> None:
+    tmp = _index_path() + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_paper_index, f)
+    os.replace(tmp, _index_path())
+
+
+def path_for_digest(digest: str) -> str:
+    if not _DIGEST_RE.match(digest):
+        raise ValueError(f"Invalid digest: {digest}")
+    return os.path.join(PDF_STORE_DIR, digest[:2], f"{digest}.pdf")
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def store_file(src: str) -> str:
+    """Copy a file into the store (once per content) and return its digest."""
+    digest = file_digest(src)
+    dest = path_for_digest(digest)
+    if not os.path.isfile(dest):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), suffix=".part")
+        os.close(fd)
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+    return digest
+
+
+def _stored_digest(paper: str) -> Optional[str]:
+    with _store_lock:
+        _load_index()
+        digest = _paper_index.get(paper)
+    return digest if digest and os.path.isfile(path_for_digest(digest)) else None
+
+
+def store_paper(paper: str) -> str:
+    """Digest of a paper's qpaper.pdf, downloading and storing it on first use."""
+    digest = _stored_digest(paper)
+    if digest:
+        return digest
+
+    with _store_lock:
+        lock = _paper_locks.setdefault(paper, threading.Lock())
+    try:
+        with lock:
+            digest = _stored_digest(paper)
+            if digest:
+                return digest
+            src = questions.get_paper_file(paper, "qpaper.pdf")
+            digest = store_file(src)
+            with _store_lock:
+                _paper_index[paper] = digest
+                _save_index()
+            return digest
+    finally:
+        with _store_lock:
+            if _paper_locks.get(paper) is lock:
+                del _paper_locks[paper]
+
+
+# ------------------------------
+# Conditional + range handling
+# ------------------------------
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    tags = [t.strip() for t in header.split(",")]
+    return etag in tags or f"W/{etag}" in tags
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return _etag_matches(inm, etag)
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(mtime) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=` range into inclusive (start, end).
+    Returns None for multi-range/malformed headers (serve the full file),
+    raises ValueError when the range is unsatisfiable.
+    """
+    m = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", header)
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else size - 1
+    else:
+        suffix = int(m.group(2))
+        if suffix == 0:
+            raise ValueError("empty suffix range")
+        start, end = max(0, size - suffix), size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+# ------------------------------
+# Response
+# ------------------------------
+class PDFFileResponse(Response):
+    """Sends `count` bytes of `path` from `offset`, zero-copy when the server supports it."""
+
+    media_type = "application/pdf"
+
+    def __init__(self, path: str, offset: int, count: int, status_code: int, headers: Dict[str, str]):
+        super().__init__(content=None, status_code=status_code, headers=headers)
+        self.path = path
+        self.offset = offset
+        self.count = count
+        self.headers["content-length"] = str(count)
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if "http.response.zerocopy" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopy",
+                    "file": f.fileno(),
+                    "offset": self.offset,
+                    "count": self.count,
+                })
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.offset)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b""})
+
+
+def pdf_response(request: Request, path: str, digest: Optional[str] = None,
+                 filename: str = "qpaper.pdf") -> Response:
+    """Serve a PDF with validators, 304s and byte-range support."""
+    st = os.stat(path)
+    size = st.st_size
+    if digest:
+        etag = f'"{digest}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = f'W/"{int(st.st_mtime_ns):x}-{size:x}"'
+        cache_control = DEFAULT_CACHE_CONTROL
+
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(st.st_mtime, usegmt=True),
+        "cache-control": cache_control,
+        "accept-ranges": "bytes",
+        "content-disposition": f'attachment; filename="{filename}"',
+    }
+
+    if _not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers={k: headers[k] for k in ("etag", "last-modified", "cache-control")})
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range.strip() != etag and if_range.strip() != headers["last-modified"]:
+        range_header = None  # representation changed: send the whole file
+
+    if range_header:
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={"content-range": f"bytes */{size}", "accept-ranges": "bytes"})
+        if byte_range is not None:
+            start, end = byte_range
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            return PDFFileResponse(path, start, end - start + 1, 206, headers)
+
+    return PDFFileResponse(path, 0, size, 200, headers)
@@ -6,32 +6,41 @@ Calendar-True Study Planner
 
 Usage:
 - Set GROQ_API_KEY in your environment.
-- Call get_plan(req_dict) → returns validated JSON dict.
+- Call `await get_plan(req_dict)` → returns validated JSON dict.
 
 This script does **two** things so the AI stops making week-number mistakes:
-1) Strengthened prompt: forces the model to assign week_number by real calendar Monday–Sunday windows (start at week 0).
-2) Validator/Regrouper: after the model returns JSON, we re-check every date and regroup them into correct calendar weeks, renumbered from week 0.
+1) Local calendar skeleton: every study date and its Monday–Sunday week is computed here;
+   the model only fills in tasks, one week (or WEEKS_PER_CALL weeks) per call, with the
+   calls made concurrently and stitched back into the study_plan schema.
+2) Validator/Regrouper: after stitching, we re-check every date and regroup them into correct calendar weeks, renumbered from week 0.
 """
 
 from __future__ import annotations
+import asyncio
 import os
 import json
 import re
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta
 from typing import List, Dict, Any, Tuple
-import requests
-from dotenv import load_dotenv
+
+import config  # loads .env once, before the config below is read
+import llm_client
+import llm_json
+import metrics
+import router
 
 
 # ------------------------------
 # Config
 # ------------------------------
-load_dotenv()
-
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 LLAMA_MODEL = "llama-3.1-8b-instant"
-GROQ_ENDPOINT = "https://api.groq.com/openai/v1/chat/completions"
+# Model used by /generate_planner and /replan (hedged with its fallback, see router.py)
+PLANNER_MODEL = os.getenv("PLANNER_MODEL", "llama3-8b-8192")
+
+# Weeks of tasks generated per LLM call, and that call's output budget
+WEEKS_PER_CALL = int(os.getenv("PLANNER_WEEKS_PER_CALL", "1"))
+CHUNK_MAX_TOKENS = int(os.getenv("PLANNER_CHUNK_MAX_TOKENS", "2500"))
 
 
 # ------------------------------
@@ -92,115 +101,117 @@ def iso(d: date) -> str:
 
 
 # ------------------------------
-# Prompt Builder
+# Calendar Skeleton
 # ------------------------------
-def create_planner_prompt(req: StudentRequest) -> str:
-    subjects = ", ".join(req.subjects)
-    chapters = ", ".join(req.chapters)
-    strengths = ", ".join(req.strengths)
-    weaknesses = ", ".join(req.weaknesses)
-
-    start = to_date(req.start_date)
+def study_dates(req: StudentRequest, start: date = None) -> List[date]:
+    """All allowed study dates from start_date (or `start`) up to (not including) the target date."""
+    start = start or to_date(req.start_date)
     target = to_date(req.target)
+    allowed = {d.strip().lower() for d in req.days_per_week}
+    dates = []
+    d = start
+    while d < target:
+        if WEEKDAY_TO_NAME[d.weekday()] in allowed:
+            dates.append(d)
+        d += timedelta(days=1)
+    return dates
+
+
+def build_calendar_skeleton(dates: List[date]) -> List[Dict[str, Any]]:
+    """Group dates into Monday–Sunday weeks numbered 0,1,2,... with empty task lists."""
+    weeks: List[Dict[str, Any]] = []
+    current_monday = None
+    for d in sorted(dates):
+        if monday_of(d) != current_monday:
+            current_monday = monday_of(d)
+            weeks.append({"week_number": len(weeks), "days": []})
+        weeks[-1]["days"].append({"date": iso(d), "tasks": []})
+    return weeks
+
+
+def allocate_chapters(chapters: List[str], weeks: List[Dict[str, Any]]) -> List[List[str]]:
+    """
+    Spread chapters over the weeks in order, in proportion to study days.
+    About one day in seven is held back at the end for revision/buffer.
+    """
+    day_counts = [len(wk["days"]) for wk in weeks]
+    total_days = sum(day_counts)
+    allocation: List[List[str]] = [[] for _ in weeks]
+    if not chapters or not total_days:
+        return allocation
 
-    wk0_start = monday_of(start)
-    wk0_end = sunday_of(start)
-    wk1_start = wk0_start + timedelta(days=7)
-    wk1_end = wk1_start + timedelta(days=6)
+    revision_days = total_days // 7 if total_days > len(chapters) else 0
+    content_days = total_days - revision_days
 
-    # Example dates to anchor the model in the **actual** calendar
-    example_mapping = (
-        f"Start date {iso(start)} falls in calendar week: {iso(wk0_start)} to {iso(wk0_end)} — this is \"week_number\": 0.\n"
-        f"The next calendar week begins on {iso(wk1_start)} and ends on {iso(wk1_end)} — this is \"week_number\": 1."
-    )
+    # Day position (0-based) at which each chapter starts
+    week_of_day = [i for i, n in enumerate(day_counts) for _ in range(n)]
+    for idx, chapter in enumerate(chapters):
+        position = idx * content_days // len(chapters)
+        allocation[week_of_day[position]].append(chapter)
+    return allocation
+
+
+# ------------------------------
+# Prompt Builder
+# ------------------------------
+def create_week_tasks_prompt(req: StudentRequest, weeks: List[Dict[str, Any]], chapters: List[str]) -> str:
+    """Prompt that only asks for tasks on the given, already-fixed study dates."""
+    dates = [day["date"] for wk in weeks for day in wk["days"]]
+    focus = ", ".join(chapters) if chapters else "No new chapters: revision, practice papers and buffer for weak areas"
 
-    # JSON example needs escaped braces inside f-string
     example_json = (
         '{\n'
-        ' "target_date": "' + iso(target) + '",\n'
-        ' "study_plan": [\n'
-        ' {\n'
-        ' "week_number": 0,\n'
         ' "days": [\n'
-        ' { "date": "' + iso(start) + '", "tasks": [] }\n'
-        ' ]\n'
-        ' },\n'
-        ' {\n'
-        ' "week_number": 1,\n'
-        ' "days": [\n'
-        ' { "date": "' + iso(wk1_start) + '", "tasks": [] }\n'
-        ' ]\n'
-        ' }\n'
+        ' { "date": "' + dates[0] + '", "tasks": [\n'
+        '   { "subject": "Physics", "chapter": "Refraction", "task": "Read notes and solve 10 numericals", "estimated_time": 45 },\n'
+        '   { "break": 20 },\n'
+        '   { "subject": "Chemistry", "chapter": "Mole Concept", "task": "Revise formulas", "estimated_time": 30 }\n'
+        ' ] }\n'
         ' ]\n'
         '}'
     )
 
-    prompt = f"""
-You are an expert ICSE Class 10 study planner. Generate a highly detailed, realistic plan.
+    return f"""
+You are an expert ICSE Class 10 study planner. Fill in realistic study tasks for the dates below.
 
 STUDENT INFO
-- Subjects: {subjects}
-- Chapters: {chapters}
+- Subjects: {", ".join(req.subjects)}
+- All chapters in the plan: {", ".join(req.chapters)}
 - Study goals: {req.study_goals}
-- Strengths: {strengths}
-- Weaknesses: {weaknesses}
-- Start date (YYYY-MM-DD): {iso(start)}
-- Target date (YYYY-MM-DD): {iso(target)}
+- Strengths: {", ".join(req.strengths)}
+- Weaknesses: {", ".join(req.weaknesses)}
+- Target date (YYYY-MM-DD): {iso(to_date(req.target))}
 - Time available per study day: {req.time_available} minutes
-- Days until target: {req.days_until_target}
-- Allowed study days each week (lowercase): {', '.join(req.days_per_week)}
-
-CRITICAL: CALENDAR WEEK GROUPING (STRICT)
-1) A week is **always** Monday–Sunday.
-2) Use **week_number starting at 0**: week 0 = calendar week that contains the start date; week 1 = the next Monday–Sunday; etc.
-3) How to assign week_number:
-   - First list **all study dates** in chronological order using only the allowed weekdays.
-   - For each date, determine its calendar Monday–Sunday window. Assign week_number by that window.
-   - Do **not** increment week_number based on the count of study days. Only increment when the **calendar Monday** changes.
-4) Sorting: Group by week_number, then sort days by date ascending. Week numbers must be contiguous 0,1,2,... (no gaps).
-5) Do **not** merge dates from different Monday–Sunday windows into the same week, and do **not** split a window across multiple week_number blocks.
-
-Anchor to the actual calendar for this student:
-{example_mapping}
+
+THIS PART OF THE PLAN
+- Study dates (fixed, YYYY-MM-DD): {", ".join(dates)}
+- Chapters to cover on these dates: {focus}
 
 TASK RULES
-- Use only the allowed study days per week.
+- Give tasks for **every** date listed above and **only** those dates. Do not add, drop or change dates.
 - Each day may have 1–3 tasks, separated by a 20-minute break object: {{"break": 20}}.
-- Estimated times must fit within the per-day time budget.
-- Prioritize weaker subjects first, then strengths. Mix subjects across the week.
-- If syllabus completes early, allocate revision/buffer days.
+- Estimated times (minutes) must fit within the per-day time budget.
+- Prioritize weaker subjects first, then strengths. Mix subjects across the days.
 
 OUTPUT RULES
 - Return **ONLY** a valid JSON object. No commentary.
-- Dates must be chronological and correctly grouped by calendar week_number.
 - Schema must follow exactly: {example_json}
-- Populate the tasks realistically for this student.
-- I NEED THE JSON ONLY. NO TEXT BEFORE OR AFTER THAT. STRICTLY JSON. NO "HERES UR JSON" TEXT. NO. I NEED ONLY AND ONLY THE JSON IN THE RETURN OUPUT. ONLY JSON. NOTHING ELSE
-
-SELF-CHECK BEFORE ANSWERING (MANDATORY)
-- For each week block, compute the Monday and Sunday of every date in the block. They must all be identical Monday–Sunday ranges.
-- If any date is outside its block's Monday–Sunday, fix the grouping and renumber from week 0.
-- Ensure study_plan weeks are sorted by week_number and days sorted by date.
+- I NEED THE JSON ONLY. NO TEXT BEFORE OR AFTER THAT. STRICTLY JSON.
 """
-    return prompt
 
 
 # ------------------------------
 # API Call
 # ------------------------------
-def ask_groq_api(
+async def ask_groq_api(
     prompt: str,
     model: str = LLAMA_MODEL,
     temperature: float = 0.2,
     max_tokens: int = 5000,
 ) -> str:
-    if not GROQ_API_KEY:
+    if not llm_client.api_key():
         raise RuntimeError("GROQ_API_KEY not set in environment.")
 
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json",
-    }
     payload = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
@@ -208,7 +219,7 @@ def ask_groq_api(
         "max_tokens": max_tokens,
     }
 
-    resp = requests.post(GROQ_ENDPOINT, headers=headers, json=payload, timeout=60)
+    resp = await router.post_chat(payload, timeout=60)
     resp.raise_for_status()
     data = resp.json()
 
@@ -219,20 +230,17 @@ def ask_groq_api(
 # Post-processing: Validate & Fix Week Grouping
 # ------------------------------
 def _extract_json(text: str) -> str:
-    # Find the first '{' and the last '}' and extract everything in between
-    start = text.find("{")
-    end = text.rfind("}")
-    if start != -1 and end != -1 and end > start:
-        return text[start:end + 1]
-    raise ValueError("No JSON object found in text")
-
-    # Fallback: find first '{' and last '}'
-    start = text.find("{")
-    end = text.rfind("}")
-    if start != -1 and end != -1 and end > start:
-        return text[start:end + 1]
-
-    return text
+    # Single-pass extraction with repair (chatter, fences, trailing commas, truncation)
+    try:
+        result = llm_json.extract_json(text)
+    except ValueError:
+        metrics.JSON_PARSE_FAILURES.inc(source="planner")
+        raise
+    for repair in result.repairs:
+        metrics.JSON_REPAIRS.inc(source="planner", repair=repair)
+    if result.repairs:
+        print("Repaired planner JSON:", ", ".join(result.repairs), flush=True)
+    return result.text
 
 
 def _date_range_key(dstr: str) -> Tuple[str, str]:
@@ -303,22 +311,110 @@ def validate_and_fix_calendar_weeks(plan: Dict[str, Any]) -> Dict[str, Any]:
 
 
 # ------------------------------
-# High-level helper
+# Parallel task generation
 # ------------------------------
-def get_plan(req_dict: Dict[str, Any]) -> Dict[str, Any]:
-    req = StudentRequest.from_dict(req_dict)
-    prompt = create_planner_prompt(req)
-    raw = ask_groq_api(prompt)
-
-    # Parse JSON safely
+async def _fill_week_chunk(req: StudentRequest, weeks: List[Dict[str, Any]], chapters: List[str], model: str) -> bool:
+    """Ask the model for one chunk of weeks and copy tasks onto the skeleton days in place."""
+    prompt = create_week_tasks_prompt(req, weeks, chapters)
     try:
+        raw = await ask_groq_api(prompt, model, max_tokens=CHUNK_MAX_TOKENS)
         parsed = json.loads(_extract_json(raw))
     except Exception as e:
-        raise ValueError(f"Model did not return valid JSON: {e}\nRaw: {raw[:500]}")
+        print(f"Planner chunk failed (weeks {weeks[0]['week_number']}-{weeks[-1]['week_number']}): {e}", flush=True)
+        return False
+
+    tasks_by_date = {}
+    for day in parsed.get("days", []) if isinstance(parsed, dict) else []:
+        if isinstance(day, dict) and isinstance(day.get("tasks"), list):
+            tasks_by_date[day.get("date")] = day["tasks"]
+    for wk in weeks:
+        for day in wk["days"]:
+            day["tasks"] = tasks_by_date.get(day["date"], [])
+    return True
+
+
+async def fill_plan_tasks(
+    req: StudentRequest,
+    weeks: List[Dict[str, Any]],
+    model: str = LLAMA_MODEL,
+    chapters: List[str] = None,
+) -> List[str]:
+    """
+    Fill tasks for all skeleton weeks, WEEKS_PER_CALL weeks per concurrent call.
+    `chapters` defaults to req.chapters. Returns the dates whose generation
+    failed (left with empty tasks).
+    """
+    allocation = allocate_chapters(req.chapters if chapters is None else chapters, weeks)
+    step = max(1, WEEKS_PER_CALL)
+    chunks = [(weeks[i:i + step], [c for a in allocation[i:i + step] for c in a])
+              for i in range(0, len(weeks), step)]
+
+    results = await asyncio.gather(*(_fill_week_chunk(req, wks, chs, model) for wks, chs in chunks))
+    return [day["date"] for (wks, _), ok in zip(chunks, results) if not ok for wk in wks for day in wk["days"]]
+
+
+def _weeks_containing(plan: Dict[str, Any], dates: List[str]) -> List[int]:
+    wanted = set(dates)
+    return [wk["week_number"] for wk in plan.get("study_plan", [])
+            if any(day.get("date") in wanted for day in wk.get("days", []))]
+
 
-    # Validate / fix calendar weeks
-    fixed = validate_and_fix_calendar_weeks(parsed)
-    return fixed
+async def generate_plan(req: StudentRequest, model: str = LLAMA_MODEL) -> Dict[str, Any]:
+    """Build the calendar locally, have the model fill tasks per week concurrently, and stitch."""
+    weeks = build_calendar_skeleton(study_dates(req))
+    failed = await fill_plan_tasks(req, weeks, model)
+
+    plan: Dict[str, Any] = {"target_date": iso(to_date(req.target)), "study_plan": weeks}
+    plan = validate_and_fix_calendar_weeks(plan)
+    if failed:
+        plan["incomplete_weeks"] = _weeks_containing(plan, failed)
+    return plan
+
+
+async def replan(
+    req: StudentRequest,
+    plan: Dict[str, Any],
+    from_date: List[int],
+    completed_chapters: List[str],
+    model: str = LLAMA_MODEL,
+) -> Dict[str, Any]:
+    """
+    Keep every day of `plan` before `from_date` untouched and regenerate only
+    the days from `from_date` to the target, covering the chapters not yet
+    completed. Weeks are regrouped/renumbered by validate_and_fix_calendar_weeks.
+    """
+    cutoff = to_date(from_date)
+    past_days = []
+    for wk in plan.get("study_plan", []):
+        for day in wk.get("days", []):
+            try:
+                if datetime.strptime(day["date"], "%Y-%m-%d").date() < cutoff:
+                    past_days.append(day)
+            except (KeyError, TypeError, ValueError):
+                continue
+
+    done = {c.strip().lower() for c in completed_chapters}
+    remaining = [c for c in req.chapters if c.strip().lower() not in done]
+
+    start = max(cutoff, to_date(req.start_date))
+    future_weeks = build_calendar_skeleton(study_dates(req, start=start))
+    failed = await fill_plan_tasks(req, future_weeks, model, chapters=remaining)
+
+    new_plan = {k: v for k, v in plan.items() if k not in ("study_plan", "incomplete_weeks")}
+    new_plan["target_date"] = iso(to_date(req.target))
+    new_plan["study_plan"] = [{"week_number": 0, "days": past_days + [d for wk in future_weeks for d in wk["days"]]}]
+    new_plan = validate_and_fix_calendar_weeks(new_plan)
+    if failed:
+        new_plan["incomplete_weeks"] = _weeks_containing(new_plan, failed)
+    return new_plan
+
+
+# ------------------------------
+# High-level helper
+# ------------------------------
+async def get_plan(req_dict: Dict[str, Any]) -> Dict[str, Any]:
+    req = StudentRequest.from_dict(req_dict)
+    return await generate_plan(req)
 
 
 
@@ -1,23 +1,137 @@
-from huggingface_hub import hf_hub_download
+"""
+Question papers from the QnA dataset: fields.json per paper, plus its PDF.
+
+The parsed fields index is deliberately per-process (a TTLCache, not
+make_cache), whatever CACHE_BACKEND says:
+- It is read on every /questions request. The shared SQLite backend would
+  turn that dict lookup into a file read plus json.loads of the whole paper.
+- retrieval's BM25 index recognises an unchanged paper by getting the same
+  object back, so it need not re-hash the paper on each request.
+- Papers are immutable dataset files, so workers never disagree on content;
+  sharing would only save one load per worker, which the on-disk mirror /
+  HF cache already makes cheap, and QNA_PRELOAD warms at startup.
+Loads are serialised per paper (see get_fields), not per process.
+"""
 import json
+import os
+import threading
+import time
 
-def get_questions(filename: str):
+import config  # loads .env once, before the config below is read
+import metrics
+from cache import TTLCache
+
+# Dataset with one folder per paper: <paper>/fields.json, <paper>/qpaper.pdf
+REPO_ID = "A2coder75/QnA_All"
+
+# Optional on-disk mirror of the dataset (same layout). Downloads land here too.
+QNA_MIRROR_DIR = os.getenv("QNA_MIRROR_DIR", "")
+# Never touch the network: serve from the mirror / HF cache only.
+QNA_OFFLINE = os.getenv("QNA_OFFLINE", "0") == "1"
+# Comma-separated paper names to load at startup.
+QNA_PRELOAD = [p.strip() for p in os.getenv("QNA_PRELOAD", "").split(",") if p.strip()]
+
+# Index of parsed fields.json keyed by paper name; per-process on purpose (see above).
+QNA_FIELDS_CACHE_SIZE = int(os.getenv("QNA_FIELDS_CACHE_SIZE", "512"))
+QNA_FIELDS_CACHE_TTL = float(os.getenv("QNA_FIELDS_CACHE_TTL", "604800"))
+_fields_index = TTLCache(maxsize=QNA_FIELDS_CACHE_SIZE, ttl=QNA_FIELDS_CACHE_TTL)
+# One lock per paper being loaded, so a slow download only blocks requests for that paper.
+# _locks_lock guards the dict and is never held across I/O.
+_paper_locks = {}
+_locks_lock = threading.Lock()
+
+
+def pdf_url_for(filename: str) -> str:
+    return f"https://huggingface.co/datasets/{REPO_ID}/resolve/main/{filename}/qpaper.pdf"
+
+
+def _mirror_path(filename: str, name: str) -> str:
+    return os.path.join(QNA_MIRROR_DIR, filename, name)
+
+
+def get_paper_file(filename: str, name: str) -> str:
+    """Local path of <paper>/<name>: the mirror if present, else the HF hub (or its cache)."""
+    if ".." in filename.split("/"):
+        raise ValueError(f"Invalid paper name: {filename}")
+
+    if QNA_MIRROR_DIR and os.path.isfile(_mirror_path(filename, name)):
+        return _mirror_path(filename, name)
+
+    # Imported on first download: huggingface_hub is slow to import and
+    # mirror-served papers never need it.
+    from huggingface_hub import hf_hub_download
+
+    kwargs = {"local_dir": QNA_MIRROR_DIR} if QNA_MIRROR_DIR else {}
+    started = time.perf_counter()
     try:
-        fields_path = hf_hub_download(
-            repo_id="A2coder75/QnA_All",
+        return hf_hub_download(
+            repo_id=REPO_ID,
             repo_type="dataset",
-            filename=f"{filename}/fields.json"
+            filename=f"{filename}/{name}",
+            local_files_only=QNA_OFFLINE,
+            **kwargs,
         )
+    finally:
+        metrics.HF_DOWNLOAD_LATENCY.observe(time.perf_counter() - started, file=name)
+
+
+def _load_fields(filename: str):
+    """Read and parse a paper's fields.json."""
+    fields_path = get_paper_file(filename, "fields.json")
+    with open(fields_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_fields(filename: str):
+    """Parsed fields for a paper; loaded once, then served from the index."""
+    fields = _fields_index.get(filename)
+    if fields is not None:
+        return fields
+    with _locks_lock:
+        lock = _paper_locks.setdefault(filename, threading.Lock())
+    try:
+        with lock:
+            fields = _fields_index.get(filename)
+            if fields is None:
+                fields = _load_fields(filename)
+                _fields_index.set(filename, fields)
+        return fields
+    finally:
+        with _locks_lock:
+            if _paper_locks.get(filename) is lock:
+                del _paper_locks[filename]
+
 
-        # Debug: read raw content
-        with open(fields_path, "r", encoding="utf-8") as f:
-            content = f.read()
-        print("Raw content preview:", content[:500], flush=True)  # first 500 chars
+def preload(papers=None) -> dict:
+    """Warm the index with the configured papers (QNA_PRELOAD by default)."""
+    loaded, failed = [], {}
+    for paper in (QNA_PRELOAD if papers is None else papers):
+        try:
+            get_fields(paper)
+            loaded.append(paper)
+        except Exception as e:
+            failed[paper] = str(e)
+    if failed:
+        print("Preload failed for papers:", failed, flush=True)
+    return {"loaded": loaded, "failed": failed}
 
-        fields_data = json.loads(content)  # parse JSON
-        pdf_url = f"https://huggingface.co/datasets/A2coder75/QnA_All/resolve/main/{filename}/qpaper.pdf"
 
-        return {"fields": fields_data, "pdf_url": pdf_url}
+def clear_index(filename: str = None) -> None:
+    """Drop one paper (or all) from the index so it is re-read on next use."""
+    if filename is None:
+        _fields_index.clear()
+    else:
+        _fields_index.delete(filename)
+
+
+def cache_stats() -> dict:
+    return _fields_index.stats()
+
+
+def get_questions(filename: str):
+    try:
+        fields_data = get_fields(filename)
+        return {"fields": fields_data, "pdf_url": pdf_url_for(filename)}
 
     except Exception as e:
         print("Error in get_questions:", str(e), flush=True)
@@ -0,0 +1,256 @@
+"""
+Local BM25 index over the QnA dataset's questions and official answers.
+
+Every question of a loaded paper (fields.json) is one document: its
+question text plus its answer. Documents are ranked by BM25; each of the
+top hits is then scored on two idf-weighted overlaps, which unlike raw
+BM25 cannot be saturated by a short document or a repeated term:
+- confidence:      share of the doubt's terms found in the document
+- question_match:  F1 overlap between the doubt's terms and the question
+                   text alone (answer words do not count)
+
+solve_doubt looks a doubt up here first:
+- question_match and confidence >= RETRIEVAL_DIRECT_THRESHOLD, and the
+  doubt gives the same numbers as the question: the official answer is
+  returned as is, with no LLM call (a numerical with other values is
+  grounded instead, since its answer differs)
+- confidence >= RETRIEVAL_GROUNDING_THRESHOLD: the answer is passed to the
+  model as a short reference to explain from. A match on the answer text
+  alone also needs at least two doubt terms.
+
+Papers are indexed incrementally (preload, then every paper served by
+/questions); re-indexing a paper replaces its documents.
+
+Config (environment):
+- RETRIEVAL_DIRECT_THRESHOLD     default 0.75
+- RETRIEVAL_GROUNDING_THRESHOLD  default 0.35
+- RETRIEVAL_MAX_REFERENCE_CHARS  answer text passed as grounding (default 600)
+"""
+
+from __future__ import annotations
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import config  # loads .env once, before the config below is read
+import questions
+from cache import make_key
+
+DIRECT_THRESHOLD = float(os.getenv("RETRIEVAL_DIRECT_THRESHOLD", "0.75"))
+GROUNDING_THRESHOLD = float(os.getenv("RETRIEVAL_GROUNDING_THRESHOLD", "0.35"))
+MAX_REFERENCE_CHARS = int(os.getenv("RETRIEVAL_MAX_REFERENCE_CHARS", "600"))
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "of", "to", "in", "on", "at",
+    "for", "by", "with", "as", "and", "or", "it", "its", "this", "that", "what", "why", "how",
+    "when", "which", "who", "do", "does", "did", "can", "i", "me", "my", "you", "please",
+    "explain", "tell", "about", "define", "give", "state", "mean", "meant",
+}
+_TOKEN = re.compile(r"[0-9]+(?:\.[0-9]+)?|[a-z]+")
+
+
+def _is_number(token: str) -> bool:
+    return token[0].isdigit()
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens without stopwords, with a plural 's' dropped.
+    Numbers are kept whatever their length, in canonical form ("12.0" -> "12").
+    """
+    tokens = []
+    for token in _TOKEN.findall((text or "").lower()):
+        if _is_number(token):
+            tokens.append(f"{float(token):g}")
+            continue
+        if token in _STOPWORDS or len(token) < 2:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _question_text(field: Dict[str, Any]) -> str:
+    return str(field.get("question", field.get("question_text", "")) or "")
+
+
+def _answer_text(field: Dict[str, Any]) -> str:
+    return str(field.get("answer", field.get("correct_answer", "")) or "")
+
+
+# ------------------------------
+# Index
+# ------------------------------
+class BM25Index:
+    """Inverted index with incremental add / remove by paper."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs: Dict[Tuple[str, str], Dict[str, Any]] = {}  # (paper, question_number) -> doc
+        self._postings: Dict[str, Dict[Tuple[str, str], int]] = {}  # term -> {doc id: tf}
+        self._papers: Dict[str, str] = {}  # paper -> signature of its indexed fields
+        self._sources: Dict[str, Any] = {}  # paper -> the fields object it was indexed from
+        self._total_length = 0
+
+    def _remove(self, paper: str) -> None:
+        for doc_id in [d for d in self._docs if d[0] == paper]:
+            doc = self._docs.pop(doc_id)
+            self._total_length -= doc["length"]
+            for term in doc["terms"]:
+                postings = self._postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[term]
+        self._papers.pop(paper, None)
+        self._sources.pop(paper, None)
+
+    def add_paper(self, paper: str, fields: List[Dict[str, Any]]) -> bool:
+        """(Re)index a paper's questions; False if it is already indexed unchanged."""
+        # Same object as last time (the questions index hands out its cached
+        # fields): unchanged, without hashing the paper.
+        if self._sources.get(paper) is fields:
+            return False
+        signature = make_key(fields)
+        with self._lock:
+            if self._papers.get(paper) == signature:
+                self._sources[paper] = fields
+                return False
+            self._remove(paper)
+            for field in fields if isinstance(fields, list) else []:
+                if not isinstance(field, dict) or "question_number" not in field:
+                    continue
+                question, answer = _question_text(field), _answer_text(field)
+                question_terms = set(tokenize(question))
+                terms = Counter(tokenize(f"{question} {answer}"))
+                if not terms or not answer:
+                    continue
+                doc_id = (paper, str(field["question_number"]))
+                length = sum(terms.values())
+                self._docs[doc_id] = {"question": question, "answer": answer, "terms": terms,
+                                     "question_terms": question_terms, "length": length}
+                self._total_length += length
+                for term, tf in terms.items():
+                    self._postings.setdefault(term, {})[doc_id] = tf
+            self._papers[paper] = signature
+            self._sources[paper] = fields
+            return True
+
+    def remove_paper(self, paper: str) -> None:
+        with self._lock:
+            self._remove(paper)
+
+    def _idf(self, df: int) -> float:
+        n = len(self._docs)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _weight(self, terms) -> float:
+        return sum(self._idf(len(self._postings.get(term, {}))) for term in terms)
+
+    def search(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Best BM25 matches with their confidence and question_match (0..1)."""
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self._docs:
+                return []
+            avg_length = self._total_length / len(self._docs)
+            scores: Dict[Tuple[str, str], float] = {}
+            for term in terms:
+                postings = self._postings.get(term, {})
+                idf = self._idf(len(postings))
+                for doc_id, tf in postings.items():
+                    norm = K1 * (1 - B + B * self._docs[doc_id]["length"] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+            ranked = sorted(scores.items(), key=lambda s: s[1], reverse=True)[:k]
+
+            query_weight = self._weight(terms)
+            hits = []
+            numbers = {t for t in terms if _is_number(t)}
+            for doc_id, score in ranked:
+                doc = self._docs[doc_id]
+                matched = terms & set(doc["terms"])
+                common = self._weight(terms & doc["question_terms"])
+                question_weight = self._weight(doc["question_terms"])
+                hits.append({
+                    "paper": doc_id[0],
+                    "question_number": doc_id[1],
+                    "question": doc["question"],
+                    "answer": doc["answer"],
+                    "score": round(score, 4),
+                    "matched_terms": len(matched),
+                    "confidence": round(self._weight(matched) / query_weight, 4) if query_weight else 0.0,
+                    "question_match": round(2 * common / (query_weight + question_weight), 4) if common else 0.0,
+                    "same_numbers": numbers == {t for t in doc["question_terms"] if _is_number(t)},
+                })
+            return hits
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"papers": len(self._papers), "documents": len(self._docs), "terms": len(self._postings)}
+
+
+_index = BM25Index()
+
+
+# ------------------------------
+# API
+# ------------------------------
+def index_paper(paper: str) -> bool:
+    """Add (or refresh) one paper from the dataset; False if unchanged or unavailable."""
+    try:
+        return _index.add_paper(paper, questions.get_fields(paper))
+    except Exception as e:
+        print(f"Retrieval indexing failed for {paper}:", str(e), flush=True)
+        return False
+
+
+def index_papers(papers: List[str]) -> int:
+    return sum(index_paper(paper) for paper in papers)
+
+
+def _is_direct(hit: Dict[str, Any]) -> bool:
+    # Same numerical with other given values: the stored answer would be wrong.
+    if not hit["same_numbers"]:
+        return False
+    return hit["question_match"] >= DIRECT_THRESHOLD and hit["confidence"] >= DIRECT_THRESHOLD
+
+
+def _can_ground(hit: Dict[str, Any]) -> bool:
+    if hit["confidence"] < GROUNDING_THRESHOLD:
+        return False
+    # One doubt word found somewhere in an answer says little about the question.
+    return hit["question_match"] >= GROUNDING_THRESHOLD or hit["matched_terms"] >= 2
+
+
+def best_match(doubt: str) -> Optional[Dict[str, Any]]:
+    """
+    Best usable match, tagged "direct" or "grounding": the first of the top
+    BM25 hits whose question matches the doubt, else the top hit if it can
+    ground the answer, else None.
+    """
+    hits = _index.search(doubt)
+    for hit in hits:
+        if _is_direct(hit):
+            return dict(hit, use="direct")
+    if hits and _can_ground(hits[0]):
+        return dict(hits[0], use="grounding")
+    return None
+
+
+def reference_text(hit: Dict[str, Any]) -> str:
+    answer = hit["answer"]
+    if len(answer) > MAX_REFERENCE_CHARS:
+        answer = answer[:MAX_REFERENCE_CHARS].rsplit(" ", 1)[0] + " …"
+    question = f"Q: {hit['question']}\n" if hit["question"] else ""
+    return f"{question}A: {answer}"
+
+
+def stats() -> Dict[str, Any]:
+    return dict(_index.stats(), direct_threshold=DIRECT_THRESHOLD, grounding_threshold=GROUNDING_THRESHOLD)
@@ -0,0 +1,239 @@
+"""
+Latency-aware model routing with hedged requests.
+
+- Recent end-to-end latency is tracked per model (sliding window).
+- post_chat: if the requested model has not answered by its
+  HEDGE_PERCENTILE latency, the same payload is also sent to the model's
+  faster fallback; the first good response wins and the other call is
+  cancelled (which aborts its HTTP request).
+- stream_chat: same race, on time to first token; the losing stream is
+  closed before the winner's chunks are passed on.
+- Models without a fallback go straight to llm_client.
+
+Config (environment):
+- LLM_FALLBACKS        JSON {"model": "fallback model"} (defaults below)
+- HEDGE_PERCENTILE     latency percentile that triggers the hedge (default 95)
+- HEDGE_MIN_SAMPLES    samples needed before the percentile is used (default 20)
+- HEDGE_DEFAULT_DELAY  seconds before hedging until then (default 10)
+- HEDGE_MIN_DELAY      never hedge sooner than this, in seconds (default 1)
+- HEDGE_WINDOW         latencies kept per model (default 200)
+"""
+
+from __future__ import annotations
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+import httpx
+
+import llm_client
+import metrics
+from cache import make_key
+from scheduler import PRIORITY_BULK
+from singleflight import SingleFlight
+
+DEFAULT_FALLBACKS = {
+    "deepseek-r1-distill-llama-70b": "llama-3.3-70b-versatile",
+    "llama3-8b-8192": "llama-3.1-8b-instant",
+}
+FALLBACKS: Dict[str, str] = json.loads(os.getenv("LLM_FALLBACKS", "") or "null") or DEFAULT_FALLBACKS
+
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "10"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+
+
+# ------------------------------
+# Latency tracking
+# ------------------------------
+class LatencyTracker:
+    """Sliding window of recent latencies per model."""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float) -> None:
+        self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model: str, p: float) -> Optional[float]:
+        """p-th percentile, or None until HEDGE_MIN_SAMPLES latencies are known."""
+        samples = self._samples.get(model)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    def hedge_delay(self, model: str) -> float:
+        observed = self.percentile(model, HEDGE_PERCENTILE)
+        return max(HEDGE_MIN_DELAY, HEDGE_DEFAULT_DELAY if observed is None else observed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            model: {
+                "samples": len(samples),
+                "p50": self.percentile(model, 50),
+                "p95": self.percentile(model, 95),
+                "p99": self.percentile(model, 99),
+                "hedge_after": round(self.hedge_delay(model), 3),
+            }
+            for model, samples in self._samples.items()
+        }
+
+
+completion_latency = LatencyTracker()
+first_token_latency = LatencyTracker()
+_singleflight = SingleFlight()
+
+
+async def _timed(tracker: LatencyTracker, model: str, call: Awaitable[Any], ok: Callable[[Any], bool]) -> Any:
+    """
+    Await `call`, recording its latency when it succeeds. A call cancelled
+    for losing a race records the time it had taken so far, so slow models
+    don't look faster than they are.
+    """
+    started = time.monotonic()
+    try:
+        result = await call
+    except asyncio.CancelledError:
+        tracker.record(model, time.monotonic() - started)
+        raise
+    if ok(result):
+        tracker.record(model, time.monotonic() - started)
+    return result
+
+
+# ------------------------------
+# Hedged race
+# ------------------------------
+async def _race(
+    payload: Dict[str, Any],
+    tracker: LatencyTracker,
+    attempt: Callable[[Dict[str, Any]], Awaitable[Any]],
+    ok: Callable[[Any], bool],
+    discard: Callable[[Any], Awaitable[None]],
+) -> Any:
+    """
+    Run `attempt(payload)`; if it is still running after the model's hedge
+    delay, also run it with the fallback model and return the first result
+    that is `ok`. Results that lose are passed to `discard`.
+    """
+    model = payload.get("model", "")
+    fallback = FALLBACKS[model]
+    tasks: List[asyncio.Future] = [asyncio.ensure_future(attempt(payload))]
+    winner: Optional[asyncio.Future] = None
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=tracker.hedge_delay(model))
+        if not done:
+            metrics.LLM_HEDGES.inc(model=model, fallback=fallback)
+            tasks.append(asyncio.ensure_future(attempt(dict(payload, model=fallback))))
+
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Tasks in start order: the requested model wins ties.
+            for task in tasks:
+                if task in done and not task.exception() and ok(task.result()):
+                    winner = task
+                    break
+            if winner is not None:
+                break
+
+        if winner is None:
+            winner = tasks[0]  # nothing succeeded: report the requested model's outcome
+        if len(tasks) > 1:
+            metrics.LLM_HEDGE_WINS.inc(model=model, winner="fallback" if winner is tasks[1] else "primary")
+        return winner.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif task is not winner and not task.cancelled() and not task.exception():
+                await discard(task.result())
+
+
+# ------------------------------
+# Entry points
+# ------------------------------
+def _response_ok(response: httpx.Response) -> bool:
+    return response.status_code == 200
+
+
+async def _discard_response(response: httpx.Response) -> None:
+    await response.aclose()
+
+
+async def post_chat(
+    payload: Dict[str, Any],
+    timeout: Optional[float] = None,
+    priority: int = PRIORITY_BULK,
+) -> httpx.Response:
+    """llm_client.post_chat with latency tracking and, where a fallback exists, hedging."""
+    model = payload.get("model", "")
+    if model not in FALLBACKS:
+        return await _timed(completion_latency, model,
+                            llm_client.post_chat(payload, timeout, priority=priority), _response_ok)
+
+    async def attempt(p: Dict[str, Any]) -> httpx.Response:
+        # Not coalesced inside the race, so cancelling the loser really aborts it.
+        call = llm_client.post_chat(p, timeout, coalesce=False, priority=priority)
+        return await _timed(completion_latency, p["model"], call, _response_ok)
+
+    race = lambda: _race(payload, completion_latency, attempt, _response_ok, _discard_response)
+    return await _singleflight.do(make_key("hedged", payload), race)
+
+
+async def stream_chat(
+    payload: Dict[str, Any],
+    timeout: Optional[float] = None,
+    priority: int = PRIORITY_BULK,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    llm_client.stream_chat, hedged on time to first token. Chunks carry the
+    serving model under "model".
+    """
+    model = payload.get("model", "")
+
+    async def attempt(p: Dict[str, Any]):
+        stream = llm_client.stream_chat(p, timeout, priority)
+
+        async def first_chunk():
+            try:
+                return await stream.__anext__()
+            except StopAsyncIteration:
+                return None
+
+        first = await _timed(first_token_latency, p["model"], first_chunk(), lambda chunk: chunk is not None)
+        return p["model"], stream, first
+
+    async def discard(result) -> None:
+        await result[1].aclose()
+
+    if model in FALLBACKS:
+        serving, stream, first = await _race(payload, first_token_latency, attempt, lambda r: True, discard)
+    else:
+        serving, stream, first = await attempt(payload)
+
+    try:
+        if first is None:
+            return
+        first.setdefault("model", serving)
+        yield first
+        async for chunk in stream:
+            chunk.setdefault("model", serving)
+            yield chunk
+    finally:
+        await stream.aclose()
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "fallbacks": FALLBACKS,
+        "completion_latency": completion_latency.stats(),
+        "first_token_latency": first_token_latency.stats(),
+    }
@@ -0,0 +1,164 @@
+"""
+Precompiled grading rubrics per paper.
+
+The answer key of every question in a paper's fields.json is compiled once
+into a compact rubric:
+- numerical:   the distinct values with units ("24 cm", "4.17 D")
+- descriptive: key concepts, one per clause, with filler words dropped
+- mcq:         the correct option
+- diagram:     nothing (always full marks)
+
+Compiled rubrics are cached per paper (shared cache tier, see cache.py)
+and attached to grading items by question number, so grading prompts send
+the short rubric and a short marking preamble instead of the full answer
+text and rules. An item whose correct_answer differs from the paper's key
+gets a rubric compiled from its own answer.
+
+Config (environment):
+- RUBRIC_CACHE_SIZE   papers kept compiled (default 512)
+- RUBRIC_CACHE_TTL    seconds (default 604800)
+"""
+
+from __future__ import annotations
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import questions
+from cache import make_cache, make_key
+from local_grader import MAX_KEY_CHARS, MAX_KEY_VALUES, extract_quantities, question_kind
+
+RUBRIC_VERSION = 1
+MAX_CONCEPTS = 8
+MAX_CONCEPT_WORDS = 16
+
+RUBRIC_CACHE_SIZE = int(os.getenv("RUBRIC_CACHE_SIZE", "512"))
+RUBRIC_CACHE_TTL = float(os.getenv("RUBRIC_CACHE_TTL", "604800"))
+_rubric_cache = make_cache("rubrics", maxsize=RUBRIC_CACHE_SIZE, ttl=RUBRIC_CACHE_TTL)
+
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "being", "of", "to", "in", "on",
+    "at", "for", "by", "with", "as", "that", "this", "these", "those", "it", "its", "which",
+    "who", "whom", "there", "their", "then", "so", "also", "very", "can", "will", "shall",
+    "has", "have", "had", "do", "does", "did", "such", "into", "from", "we", "hence", "thus",
+}
+# Sentence ends (not decimal points), semicolons, bullets and (i)/(a) markers
+_CLAUSE_SPLIT = re.compile(r"\.(?=\s|$)|[;\n•]+|\s+-\s+|\(\s*[ivx]+\s*\)|\(\s*[a-h]\s*\)")
+
+
+# ------------------------------
+# Compilation
+# ------------------------------
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+
+def _compress(clause: str) -> str:
+    words = [w for w in clause.split() if w.lower().strip(",:()") not in _STOPWORDS]
+    return " ".join(words[:MAX_CONCEPT_WORDS]).strip(" ,:")
+
+
+def key_concepts(answer: str) -> List[str]:
+    """Answer text split into clauses, each stripped of filler words."""
+    concepts: List[str] = []
+    for clause in _CLAUSE_SPLIT.split(answer or ""):
+        concept = _compress(clause)
+        if len(concept) > 2 and concept.lower() not in (c.lower() for c in concepts):
+            concepts.append(concept)
+    return concepts[:MAX_CONCEPTS]
+
+
+def key_values(answer: str) -> Optional[List[str]]:
+    """Distinct quantities of a numerical key, or None for worked solutions / no values."""
+    if len(answer or "") > MAX_KEY_CHARS:
+        return None
+    values = []
+    for _, _, _, raw in extract_quantities(answer):
+        if raw not in values:
+            values.append(raw)
+    return values if 0 < len(values) <= MAX_KEY_VALUES else None
+
+
+@lru_cache(maxsize=4096)
+def compile_question(qtype: str, answer: str) -> Dict[str, Any]:
+    """Compact rubric for one answer key."""
+    kind = question_kind(qtype)
+    rubric: Dict[str, Any] = {"kind": kind, "source": make_key(_normalize(answer))}
+    if kind == "diagram":
+        return rubric
+    if kind == "mcq":
+        rubric["option"] = re.sub(r"\s+", " ", (answer or "").strip())[:MAX_KEY_CHARS]
+        return rubric
+    if kind == "numerical":
+        values = key_values(answer)
+        if values:
+            rubric["values"] = values
+            return rubric
+    rubric["concepts"] = key_concepts(answer)
+    return rubric
+
+
+def _field_answer(field: Dict[str, Any]) -> str:
+    return str(field.get("answer", field.get("correct_answer", "")) or "")
+
+
+def compile_paper(fields: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """question_number -> rubric for every question in a paper's fields.json."""
+    rubrics = {}
+    for field in fields if isinstance(fields, list) else []:
+        if not isinstance(field, dict) or "question_number" not in field:
+            continue
+        qtype = str(field.get("type", field.get("question_type", "")) or "")
+        rubrics[str(field["question_number"])] = compile_question(qtype, _field_answer(field))
+    return rubrics
+
+
+def paper_rubrics(paper: str) -> Dict[str, Dict[str, Any]]:
+    """Compiled rubrics of a paper, compiled on first use and cached."""
+    key = make_key("rubric", RUBRIC_VERSION, paper)
+    rubrics = _rubric_cache.get(key)
+    if rubrics is None:
+        rubrics = compile_paper(questions.get_fields(paper))
+        _rubric_cache.set(key, rubrics)
+    return rubrics
+
+
+# ------------------------------
+# Use in grading
+# ------------------------------
+def attach(batch: List[Dict[str, Any]], paper: str) -> List[Dict[str, Any]]:
+    """
+    Copies of the items with a "rubric" entry. Items whose question is not
+    in the paper are left as they are (graded from their full answer key).
+    """
+    try:
+        rubrics = paper_rubrics(paper) if paper else {}
+    except Exception as e:
+        print(f"Rubrics unavailable for {paper}:", str(e), flush=True)
+        rubrics = {}
+
+    out = []
+    for item in batch:
+        rubric = rubrics.get(str(item.get("question_number", "")))
+        answer = item.get("correct_answer", "")
+        if rubric is not None and answer and rubric["source"] != make_key(_normalize(answer)):
+            rubric = compile_question(item.get("type", ""), answer)  # client sent its own key
+        if rubric is not None and rubric.get("concepts") == []:
+            rubric = None  # nothing extractable: keep the full answer key
+        out.append(dict(item, rubric=rubric) if rubric is not None else item)
+    return out
+
+
+def rubric_lines(rubric: Dict[str, Any]) -> str:
+    if rubric["kind"] == "diagram":
+        return "✅ Diagram: award full marks"
+    if "option" in rubric:
+        return f"✅ Correct option: {rubric['option']}"
+    if "values" in rubric:
+        return "✅ Key values: " + " | ".join(rubric["values"])
+    return "✅ Key concepts: " + " | ".join(rubric.get("concepts", []))
+
+
+def cache_stats() -> dict:
+    return _rubric_cache.stats()
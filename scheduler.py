@@ -0,0 +1,160 @@
+"""
+Priority-aware LLM scheduler with per-model token buckets.
+
+- Each model has two buckets: requests/minute and tokens/minute.
+- Callers wait in a per-model priority queue; the head of the queue is
+  admitted as soon as both buckets can cover it, so interactive work
+  (lower priority number) always goes before bulk grading/planning.
+- Token debits are estimates up front and reconciled with the real
+  `usage.total_tokens` afterwards.
+- A 429/503 pauses the whole model (retry-after) so queued callers back
+  off together instead of producing an error storm.
+
+Config (environment):
+- GROQ_DEFAULT_RPM / GROQ_DEFAULT_TPM   limits for models not listed below
+- GROQ_MODEL_LIMITS                     JSON: {"model": [rpm, tpm], ...}
+"""
+
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+DEFAULT_RPM = float(os.getenv("GROQ_DEFAULT_RPM", "300"))
+DEFAULT_TPM = float(os.getenv("GROQ_DEFAULT_TPM", "300000"))
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` (capped at capacity) is available."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def give(self, amount: float) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ModelLimiter:
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.waiting: List[List[Any]] = []  # heap of [priority, seq]
+        self.throttled = 0
+
+    def wait_time(self, tokens: float) -> float:
+        pause = max(0.0, self.paused_until - time.monotonic())
+        return max(pause, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+
+class LLMScheduler:
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 default: Tuple[float, float] = (DEFAULT_RPM, DEFAULT_TPM)):
+        self.limits = limits or {}
+        self.default = default
+        self._models: Dict[str, ModelLimiter] = {}
+        self._seq = itertools.count()
+        self._cond: Optional[asyncio.Condition] = None
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        raw = os.getenv("GROQ_MODEL_LIMITS", "")
+        limits = {m: (float(v[0]), float(v[1])) for m, v in json.loads(raw).items()} if raw else {}
+        return cls(limits)
+
+    def _limiter(self, model: str) -> ModelLimiter:
+        if model not in self._models:
+            rpm, tpm = self.limits.get(model, self.default)
+            self._models[model] = ModelLimiter(rpm, tpm)
+        return self._models[model]
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def acquire(self, model: str, tokens: float, priority: int = PRIORITY_BULK) -> None:
+        """Wait for this caller's turn (by priority, then arrival) and debit the buckets."""
+        limiter = self._limiter(model)
+        entry = [priority, next(self._seq)]
+        cond = self._condition()
+        async with cond:
+            heapq.heappush(limiter.waiting, entry)
+            try:
+                while True:
+                    timeout = None
+                    if limiter.waiting[0] is entry:
+                        timeout = limiter.wait_time(tokens)
+                        if timeout <= 0:
+                            heapq.heappop(limiter.waiting)
+                            limiter.requests.take(1)
+                            limiter.tokens.take(tokens)
+                            cond.notify_all()
+                            return
+                    try:
+                        await asyncio.wait_for(cond.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if entry in limiter.waiting:
+                    limiter.waiting.remove(entry)
+                    heapq.heapify(limiter.waiting)
+                    cond.notify_all()
+                raise
+
+    def reconcile(self, model: str, estimated: float, actual: float) -> None:
+        """Correct the up-front token estimate once real usage is known."""
+        limiter = self._limiter(model)
+        if actual < estimated:
+            limiter.tokens.give(estimated - actual)
+        elif actual > estimated:
+            limiter.tokens.take(actual - estimated)
+
+    def penalize(self, model: str, seconds: float) -> None:
+        """Pause all calls to `model` (e.g. after a 429 with retry-after)."""
+        limiter = self._limiter(model)
+        limiter.throttled += 1
+        limiter.paused_until = max(limiter.paused_until, time.monotonic() + seconds)
+
+    def queue_depth(self) -> int:
+        return sum(len(m.waiting) for m in self._models.values())
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            model: {
+                "queued": len(m.waiting),
+                "throttled": m.throttled,
+                "paused_for": round(max(0.0, m.paused_until - now), 2),
+                "requests_available": round(m.requests.tokens, 1),
+                "tokens_available": round(m.tokens.tokens),
+            }
+            for model, m in self._models.items()
+        }
@@ -0,0 +1,51 @@
+"""
+Single-flight coalescing of identical in-flight async calls.
+
+While a call for a key is running, later callers with the same key await
+that call's result instead of starting their own. The shared call runs as
+its own task, so a caller that disconnects (is cancelled) does not cancel
+it for the others. The task does not inherit the first caller's request
+deadline (admission.py); each caller instead stops waiting at its own.
+"""
+
+from __future__ import annotations
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Dict
+
+import admission
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.deduplicated = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            context = contextvars.copy_context()
+            context.run(admission.clear_deadline)
+            task = context.run(asyncio.ensure_future, fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.deduplicated += 1
+        return await admission.within_deadline(asyncio.shield(task))
+
+    def _forget(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved so a failure with no waiters isn't logged
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.calls + self.deduplicated
+        return {
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "deduplicated": self.deduplicated,
+            "dedup_rate": round(self.deduplicated / total, 4) if total else 0.0,
+        }
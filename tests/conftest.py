@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# Modules live at the repo root; keep test runs away from the real job store.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GRADING_JOBS_DB", os.path.join(tempfile.mkdtemp(), "grading_jobs.db"))
+os.environ.setdefault("CACHE_BACKEND", "memory")
+os.environ.setdefault("QNA_PRELOAD", "")
+
+# Import the app once, after the environment above, so every module reads the test config.
+import main  # noqa: E402,F401
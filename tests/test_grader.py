@@ -0,0 +1,34 @@
+import asyncio
+import json
+import re
+
+import httpx
+
+import grader
+import llm_client
+
+ITEMS = [{"question_number": str(i), "type": "descriptive", "marks": 3,
+          "correct_answer": "Light bends", "user_answer": f"answer {i}"} for i in range(3)]
+
+
+def test_failed_shard_keeps_the_other_shards(monkeypatch):
+    def handler(request):
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        numbers = [n.strip() for n in re.findall(r"Question Number: (.+)", prompt)]
+        if "0" in numbers:
+            return httpx.Response(400, text="bad request")
+        content = json.dumps({"evaluations": [{"question_number": n, "marks_awarded": 1} for n in numbers]})
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm_client, "_client", client)
+    monkeypatch.setattr(llm_client, "get_client", lambda: client)
+    monkeypatch.setattr(grader, "shard_batch", lambda batch, marks_only=False: [[item] for item in batch])
+    grader._evaluation_cache.clear()
+
+    result = json.loads(asyncio.run(grader.evaluate_answer_batch(ITEMS, shard=True)))
+    assert result["total_marks_awarded"] == 2
+    assert result["missing"] == ["0"]
+    assert len(result["errors"]) == 1
+    cached = [grader._evaluation_cache.get(grader.evaluation_key(item)) is not None for item in ITEMS]
+    assert cached == [False, True, True]
@@ -0,0 +1,86 @@
+import json
+import re
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import grader
+import llm_client
+import main
+
+ITEM = {
+    "question_number": "7",
+    "type": "descriptive",
+    "marks": 3,
+    "correct_answer": "Light bends when it passes from one medium to another",
+    "user_answer": "light travels straight",
+}
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Fake Groq: 1 mark per question; full evaluations carry feedback."""
+    prompts = []
+
+    def handler(request):
+        if request.method == "GET":
+            return httpx.Response(200, json={})
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        prompts.append(prompt)
+        numbers = [n.strip() for n in re.findall(r"Question Number: (.+)", prompt)]
+        if "Award marks only" in prompt:
+            evaluations = [{"question_number": n, "verdict": "incorrect", "marks_awarded": 1} for n in numbers]
+        else:
+            evaluations = [{"question_number": n, "type": "descriptive", "verdict": "incorrect",
+                            "marks_awarded": 1, "total_marks": 3, "mistake": "m",
+                            "correct_answer": "c", "feedback": "f"} for n in numbers]
+        content = json.dumps({"evaluations": evaluations})
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm_client, "_client", client)
+    monkeypatch.setattr(llm_client, "get_client", lambda: client)
+    grader._evaluation_cache.clear()
+    with TestClient(main.app) as app:
+        yield app, prompts
+
+
+def test_feedback_with_client_marks_does_not_change_later_grading(llm):
+    app, prompts = llm
+    feedback = app.post("/grade_feedback", json=dict(ITEM, marks_awarded=3)).json()
+    assert feedback["marks_awarded"] == 3
+
+    graded = app.post("/grade_batch", json={"questions": [ITEM]}).json()
+    assert graded["total_marks_awarded"] == 1
+    assert len(prompts) == 2  # graded by the LLM, not served from the feedback call
+
+
+def test_feedback_rejects_marks_outside_the_question(llm):
+    app, prompts = llm
+    response = app.post("/grade_feedback", json=dict(ITEM, marks_awarded=5)).json()
+    assert "error" in response
+    assert prompts == []
+
+
+def test_marks_only_result_is_not_served_as_a_full_evaluation(llm):
+    app, prompts = llm
+    marks = app.post("/grade_batch", json={"questions": [ITEM], "marks_only": True}).json()
+    assert marks["evaluations"][0]["total_marks"] == 3
+    assert "feedback" not in marks["evaluations"][0]
+
+    full = app.post("/grade_batch", json={"questions": [ITEM]}).json()
+    assert full["evaluations"][0]["feedback"] == "f"
+    assert len(prompts) == 2
+
+
+def test_feedback_keeps_cached_marks_only_result(llm):
+    app, prompts = llm
+    app.post("/grade_batch", json={"questions": [ITEM], "marks_only": True})
+    feedback = app.post("/grade_feedback", json=ITEM).json()
+    assert feedback["feedback"] == "f"
+    assert "Marks already awarded: 1" in prompts[-1]
+
+    # Marks came from our own grading, so the evaluation is shared.
+    app.post("/grade_batch", json={"questions": [ITEM]})
+    assert len(prompts) == 2
@@ -0,0 +1,56 @@
+from local_grader import grade_locally
+
+
+def numerical(key, answer, marks=2):
+    return {"question_number": "1", "type": "numerical", "marks": marks,
+            "correct_answer": key, "user_answer": answer}
+
+
+def test_correct_value_gets_full_marks():
+    evaluation = grade_locally(numerical("f = 24 cm", "f = 24 cm"))
+    assert evaluation["marks_awarded"] == 2
+    assert evaluation["verdict"] == "correct"
+
+
+def test_equivalent_unit_is_accepted():
+    assert grade_locally(numerical("f = 24 cm", "f = 0.24 m"))["marks_awarded"] == 2
+
+
+def test_key_value_elsewhere_in_the_answer_is_not_the_students_value():
+    # 24 cm is u here; the student's f is 8 cm
+    evaluation = grade_locally(numerical("f = 24 cm", "u = 24 cm, v = 12 cm so f = 8 cm"))
+    assert evaluation["marks_awarded"] == 0
+    assert evaluation["verdict"] == "incorrect"
+
+
+def test_competing_values_without_labels_go_to_the_llm():
+    assert grade_locally(numerical("24 cm", "u = 24 cm, v = 12 cm so f = 8 cm")) is None
+
+
+def test_leftover_unit_text_goes_to_the_llm():
+    assert grade_locally(numerical("2 m/s", "2 m per second")) is None
+    assert grade_locally(numerical("2 m/s", "speed = 2 m s-1 roughly")) is None
+
+
+def test_values_are_matched_per_label():
+    key = "f = 24 cm, P = 4.17 D"
+    assert grade_locally(numerical(key, "P = 4.17 D and f = 24 cm"))["marks_awarded"] == 2
+    assert grade_locally(numerical(key, "f = 24 cm, P = 5 D"))["marks_awarded"] == 1
+
+
+def test_unrecognised_unit_goes_to_the_llm():
+    assert grade_locally(numerical("f = 24 cm", "f = 24 furlongs")) is None
+
+
+def test_mcq_and_diagram():
+    mcq = {"question_number": "2", "type": "mcq", "marks": 1, "correct_answer": "(b) 25 cm", "user_answer": "b"}
+    assert grade_locally(mcq)["marks_awarded"] == 1
+    assert grade_locally(dict(mcq, user_answer="(c)"))["marks_awarded"] == 0
+    diagram = {"question_number": "3", "type": "diagram", "marks": 2, "correct_answer": "", "user_answer": "x"}
+    assert grade_locally(diagram)["marks_awarded"] == 2
+
+
+def test_descriptive_is_left_to_the_llm():
+    item = {"question_number": "4", "type": "descriptive", "marks": 2,
+            "correct_answer": "Light bends", "user_answer": "It bends"}
+    assert grade_locally(item) is None
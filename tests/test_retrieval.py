@@ -0,0 +1,91 @@
+import pytest
+
+import retrieval
+
+FIELDS = [
+    {"question_number": "1", "question": "State Newton second law of motion",
+     "answer": "Force equals rate of change of momentum. Unlike photosynthesis, this is physics."},
+    {"question_number": "2", "question": "What is an echo?",
+     "answer": "Echo is the reflected sound heard after the original sound."},
+    {"question_number": "3", "question": "Define power of a lens and give its SI unit.",
+     "answer": "Power of a lens is the reciprocal of its focal length in metres. SI unit: dioptre."},
+    {"question_number": "4", "question": "Name the unit.", "answer": "Lens lens lens."},
+    {"question_number": "5", "answer": "Refraction is the bending of light when it passes from one medium to another."},
+    {"question_number": "6", "question": "A wire of resistance 4 ohm is connected to a 12 V battery. Find the current.",
+     "answer": "I = V/R = 3 A"},
+    {"question_number": "8", "question": "Find the focal length of a lens of power 2.5 D.", "answer": "f = 1/P = 40 cm"},
+]
+
+
+@pytest.fixture(autouse=True)
+def index(monkeypatch):
+    idx = retrieval.BM25Index()
+    idx.add_paper("p1", FIELDS)
+    monkeypatch.setattr(retrieval, "_index", idx)
+    return idx
+
+
+def test_exact_question_is_answered_directly():
+    match = retrieval.best_match("What is the SI unit of power of a lens?")
+    assert match["use"] == "direct"
+    assert match["question_number"] == "3"
+
+
+def test_answer_text_match_is_never_direct():
+    # "photosynthesis" only occurs in Q1's answer
+    assert retrieval.best_match("photosynthesis") is None
+
+
+def test_repeated_term_in_short_document_does_not_saturate():
+    hit = retrieval._index.search("lens")[0]
+    assert hit["confidence"] <= 1.0
+    match = retrieval.best_match("lens")
+    assert match is None or match["use"] == "grounding"
+
+
+def test_doubt_terms_missing_from_question_block_direct_answer():
+    match = retrieval.best_match("why is the echo of a gunshot louder in a valley")
+    assert match is None or match["use"] == "grounding"
+
+
+def test_answer_only_document_can_ground_but_not_answer():
+    match = retrieval.best_match("bending of light between medium")
+    assert match["use"] == "grounding"
+    assert match["question_number"] == "5"
+
+
+def test_reindexing_a_paper_replaces_its_documents(index):
+    assert index.add_paper("p1", FIELDS) is False
+    assert index.add_paper("p1", FIELDS[:1]) is True
+    assert index.stats()["documents"] == 1
+    assert retrieval.best_match("What is an echo?") is None
+
+
+def test_same_numerical_with_same_values_is_answered_directly():
+    match = retrieval.best_match("A wire of resistance 4 ohm is connected to a 12 V battery. Find the current.")
+    assert match["use"] == "direct"
+    assert match["question_number"] == "6"
+    # Numbers compare by value, not spelling
+    assert retrieval.best_match("Find the focal length of a lens of power 2.50 D")["use"] == "direct"
+
+
+def test_same_numerical_with_other_values_is_grounded_not_answered():
+    match = retrieval.best_match("A wire of resistance 6 ohm is connected to a 12 V battery. Find the current.")
+    assert match["use"] == "grounding"
+    assert match["question_number"] == "6"
+    assert not match["same_numbers"]
+
+    match = retrieval.best_match("Find the focal length of a lens of power 4 D")
+    assert match["use"] == "grounding"
+    assert match["question_number"] == "8"
+
+
+def test_single_digit_numbers_are_kept():
+    assert retrieval.tokenize("a 6 ohm wire and 12.0 V") == ["6", "ohm", "wire", "12"]
+
+
+def test_reindexing_the_same_fields_object_skips_hashing(index, monkeypatch):
+    fields = [dict(f) for f in FIELDS]
+    assert index.add_paper("p2", fields) is True
+    monkeypatch.setattr(retrieval, "make_key", lambda *a: pytest.fail("hashed an unchanged paper"))
+    assert index.add_paper("p2", fields) is False